@@ -0,0 +1,127 @@
+"""Startup-time benchmark for the web tier.
+
+Times `manage.py check` and an ASGI worker boot (importing
+stockproject.asgi and resolving the URLconf) in fresh interpreters, and
+reports whether pandas / numpy were imported along the way.
+
+    python benchmarks/bench_startup.py                  # current tree
+    python benchmarks/bench_startup.py --compare HEAD~1 # also time another commit
+
+The probes never touch the app's real database or Redis: DATABASE_URL
+points at a throwaway SQLite file and redis.from_url is swapped for
+fakeredis, so a tree that still resets state on startup only wipes those.
+Results are printed as JSON.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Each probe runs in a new interpreter and reports the heavy modules it pulled in on stderr
+PROBES = {
+    "manage_check": (
+        "import sys\n"
+        "from django.core.management import execute_from_command_line\n"
+        "execute_from_command_line(['manage.py', 'check'])\n"
+    ),
+    "asgi_boot": (
+        "import sys\n"
+        "from stockproject.asgi import application\n"
+        "from django.urls import get_resolver\n"
+        "get_resolver().url_patterns\n"
+    ),
+}
+# Runs first in every probe: all Redis connections go to one in-process fake server
+PRELUDE = (
+    "import fakeredis, redis\n"
+    "server = fakeredis.FakeServer()\n"
+    "redis.from_url = lambda url, **kwargs: fakeredis.FakeRedis(server=server, **kwargs)\n"
+)
+REPORT = "\nprint('__modules__', 'pandas' in sys.modules, 'numpy' in sys.modules, file=sys.stderr)\n"
+
+
+def run_probe(tree, code, db_path):
+    env = dict(
+        os.environ,
+        DJANGO_SETTINGS_MODULE="stockproject.settings",
+        PYTHONPATH=tree,
+        DATABASE_URL=f"sqlite:///{db_path}",
+        REDIS_URL="redis://localhost:6379/0",
+        RESET_ON_STARTUP="False",
+    )
+    env.setdefault("SECRET_KEY", "bench")
+    env.setdefault("JWT_SECRET_KEY", "bench")
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", PRELUDE + code + REPORT],
+        cwd=tree, env=env, capture_output=True, text=True
+    )
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"probe failed in {tree}:\n{result.stderr}")
+
+    pandas_loaded = numpy_loaded = None
+    for line in result.stderr.splitlines():
+        if line.startswith("__modules__"):
+            _, pandas_loaded, numpy_loaded = line.split()
+    return elapsed, pandas_loaded == "True", numpy_loaded == "True"
+
+
+def bench_tree(tree, runs, db_path):
+    results = {}
+    for name, code in PROBES.items():
+        timings = []
+        for _ in range(runs):
+            elapsed, pandas_loaded, numpy_loaded = run_probe(tree, code, db_path)
+            timings.append(elapsed)
+        results[name] = {
+            "median_s": round(statistics.median(timings), 4),
+            "min_s": round(min(timings), 4),
+            "runs": runs,
+            "pandas_imported": pandas_loaded,
+            "numpy_imported": numpy_loaded,
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per probe")
+    parser.add_argument("--compare", metavar="REF", help="Also benchmark this git ref (checked out in a temporary worktree)")
+    parser.add_argument("--output", help="Write the JSON results to this file as well")
+    args = parser.parse_args()
+
+    db_path = tempfile.mkstemp(prefix="bench-startup-", suffix=".sqlite3")[1]
+    try:
+        report = {"current": bench_tree(ROOT, args.runs, db_path)}
+
+        if args.compare:
+            worktree = tempfile.mkdtemp(prefix="bench-startup-")
+            subprocess.run(["git", "worktree", "add", "--detach", worktree, args.compare], cwd=ROOT, check=True, capture_output=True)
+            try:
+                report[args.compare] = bench_tree(worktree, args.runs, db_path)
+            finally:
+                subprocess.run(["git", "worktree", "remove", "--force", worktree], cwd=ROOT, capture_output=True)
+    finally:
+        os.remove(db_path)
+
+        report["speedup"] = {
+            name: round(report[args.compare][name]["median_s"] / report["current"][name]["median_s"], 2)
+            for name in PROBES
+        }
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
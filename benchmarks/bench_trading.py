@@ -0,0 +1,291 @@
+"""Trade-path benchmarks: order execution, limit-order matching, place_order and the leaderboard.
+
+Runs in-process against a throwaway SQLite database (stockproject.settings_bench)
+and fakeredis, with Celery tasks executed eagerly, so no database server,
+broker or Redis is needed:
+
+    python benchmarks/bench_trading.py
+    python benchmarks/bench_trading.py --orders 1000,10000 --users 100,1000 --output before.json
+
+Measures buy_stock / sell_stock throughput, process_limit_orders time
+against 1k/10k/100k resting orders, place_order request latency,
+get_live_prices latency per number of holdings (fresh and 304) and leaderboard time per
+user count. Results are printed as JSON together with
+the commit they were measured on, so runs can be diffed across commits.
+"""
+import argparse
+import contextlib
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from decimal import Decimal
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+TICKERS = ["AAPL", "MSFT", "GOOGL", "AMZN", "TSLA", "NVDA", "NFLX", "META"]
+PRICE = Decimal("100.00")
+BALANCE = Decimal("90000000.00")  # Near the UserProfile.balance limit, so buys never run out
+
+
+def setup(db_path):
+    os.environ["DJANGO_SETTINGS_MODULE"] = "stockproject.settings_bench"
+    os.environ["BENCH_DB"] = db_path
+
+    import django
+    from django.core.management import call_command
+
+    django.setup()
+    call_command("migrate", verbosity=0)
+    publish_prices(PRICE)
+
+
+def publish_prices(price):
+    from mainapp.feed import publish_tick
+
+    candle = {"time": "2025-01-02", "open": float(price), "high": float(price), "low": float(price), "close": float(price), "volume": 1000}
+    publish_tick({ticker: dict(candle) for ticker in TICKERS})
+
+
+def reset_db():
+    from django.contrib.auth.models import User
+
+    User.objects.all().delete()  # Cascades to profiles, holdings, orders and transactions
+
+
+def make_users(count, start=0, holdings=0):
+    """Create `count` users with a profile and `holdings` shares of every ticker."""
+    from django.contrib.auth.models import User
+    from mainapp.models import UserProfile, UserStock
+
+    users = User.objects.bulk_create(
+        [User(username=f"bench{start + i}", password="!") for i in range(count)], batch_size=2000
+    )
+    UserProfile.objects.bulk_create([UserProfile(user=user, balance=BALANCE) for user in users], batch_size=2000)
+    if holdings:
+        UserStock.objects.bulk_create(
+            [UserStock(user=user, stock=ticker, quantity=holdings, average_price=PRICE) for user in users for ticker in TICKERS],
+            batch_size=2000,
+        )
+    return users
+
+
+def summarize(timings):
+    ordered = sorted(timings)
+    return {
+        "runs": len(ordered),
+        "median_ms": round(statistics.median(ordered) * 1000, 3),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+        "min_ms": round(ordered[0] * 1000, 3),
+    }
+
+
+def bench_buy_sell(count):
+    from mainapp.order_utils import buy_stock, sell_stock
+
+    reset_db()
+    user = make_users(1)[0]
+
+    start = time.perf_counter()
+    for _ in range(count):
+        buy_stock(user, "AAPL", 1, PRICE)
+    buy_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(count):
+        sell_stock(user, "AAPL", 1, PRICE)
+    sell_elapsed = time.perf_counter() - start
+
+    return {
+        "orders": count,
+        "buy_per_s": round(count / buy_elapsed, 1),
+        "sell_per_s": round(count / sell_elapsed, 1),
+    }
+
+
+def bench_limit_orders(resting, crossing):
+    """Time one matching pass over `resting` orders of which `crossing` are triggered."""
+    from mainapp.models import LimitOrder
+    from mainapp.tasks import process_limit_orders
+
+    reset_db()
+    users = make_users(100, holdings=1000000)
+
+    orders = []
+    for i in range(resting):
+        # Away from the market on both sides: buys below it, sells above it
+        offset = Decimal(1 + i % 5000) / 100
+        side = "BUY" if i % 2 == 0 else "SELL"
+        price = PRICE - offset if side == "BUY" else PRICE + offset
+        orders.append(LimitOrder(user=users[i % len(users)], stock=TICKERS[i % len(TICKERS)], quantity=1, price=price, order_type=side))
+    for i in range(crossing):
+        side = "BUY" if i % 2 == 0 else "SELL"
+        price = PRICE + Decimal("0.50") if side == "BUY" else PRICE - Decimal("0.50")
+        orders.append(LimitOrder(user=users[i % len(users)], stock=TICKERS[i % len(TICKERS)], quantity=1, price=price, order_type=side))
+    LimitOrder.objects.bulk_create(orders, batch_size=5000)
+
+    start = time.perf_counter()
+    process_limit_orders({ticker: (PRICE, PRICE) for ticker in TICKERS})
+    match_elapsed = time.perf_counter() - start
+
+    return {
+        "resting": resting,
+        "crossing": crossing,
+        "filled": resting + crossing - LimitOrder.objects.count(),
+        "match_ms": round(match_elapsed * 1000, 3),
+    }
+
+
+def bench_place_order(count):
+    from django.test import Client
+    from django.urls import reverse
+    from mainapp.views import generate_jwt_token
+
+    reset_db()
+    user = make_users(1)[0]
+    client = Client(HTTP_AUTHORIZATION=f"Bearer {generate_jwt_token(user)}")
+    url = reverse("place_order")
+
+    results = {}
+    for name, form in (
+        ("market_buy", {"stock_symbol": "AAPL", "quantity": 1, "order_type": "market", "action": "buy"}),
+        ("limit_buy", {"stock_symbol": "MSFT", "quantity": 1, "order_type": "limit", "action": "buy", "price": "90"}),
+    ):
+        timings = []
+        for _ in range(count):
+            start = time.perf_counter()
+            response = client.post(url, form)
+            timings.append(time.perf_counter() - start)
+            if response.status_code not in (200, 202):
+                raise RuntimeError(f"place_order returned {response.status_code}: {response.content[:200]}")
+        results[name] = summarize(timings)
+    return results
+
+
+def bench_live_prices(holding_counts, repeat):
+    """get_live_prices latency for a user holding N different symbols."""
+    from django.test import Client
+    from django.urls import reverse
+    from mainapp.feed import publish_tick
+    from mainapp.models import UserStock
+    from mainapp.portfolio import bump_versions
+    from mainapp.views import generate_jwt_token
+
+    symbols = [f"SYM{i}" for i in range(max(holding_counts))]
+    candle = {"time": "2025-01-02", "open": 100.0, "high": 100.0, "low": 100.0, "close": 100.0, "volume": 1000}
+    publish_tick({symbol: dict(candle) for symbol in symbols})
+
+    reset_db()
+    user = make_users(1)[0]
+    client = Client(HTTP_AUTHORIZATION=f"Bearer {generate_jwt_token(user)}")
+    results = []
+    for count in sorted(holding_counts):
+        UserStock.objects.filter(user=user).delete()
+        UserStock.objects.bulk_create(
+            [UserStock(user=user, stock=symbol, quantity=10, average_price=PRICE) for symbol in symbols[:count]]
+        )
+        bump_versions([user.id])  # Written around the trade paths, so invalidate the snapshot by hand
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            response = client.get(reverse("get_live_prices"))
+            timings.append(time.perf_counter() - start)
+            if response.status_code != 200 or len(response.json()) != count:
+                raise RuntimeError(f"get_live_prices returned {response.status_code}: {response.content[:200]}")
+
+        # Polling with the last ETag while neither prices nor positions moved
+        etag = response["ETag"]
+        not_modified = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            response = client.get(reverse("get_live_prices"), HTTP_IF_NONE_MATCH=etag)
+            not_modified.append(time.perf_counter() - start)
+            if response.status_code != 304:
+                raise RuntimeError(f"get_live_prices returned {response.status_code} for a current ETag")
+        results.append({"holdings": count, **summarize(timings), "not_modified_median_ms": summarize(not_modified)["median_ms"]})
+    return results
+
+
+def bench_leaderboard(user_counts, repeat):
+    from django.contrib.auth.models import User
+    from django.test import Client
+    from django.urls import reverse
+    from mainapp.leaderboard import rebuild_leaderboard
+    from mainapp.views import generate_jwt_token
+
+    reset_db()
+    results = []
+    created = 0
+    for count in sorted(user_counts):
+        make_users(count - created, start=created, holdings=10)
+        created = count
+
+        # bulk_create skips the signal that enters new users, so rebuild the board (timed too)
+        start = time.perf_counter()
+        rebuild_leaderboard()
+        rebuild_elapsed = time.perf_counter() - start
+
+        client = Client(HTTP_AUTHORIZATION=f"Bearer {generate_jwt_token(User.objects.first())}")
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            response = client.get(reverse("leaderboard"))
+            timings.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                raise RuntimeError(f"leaderboard returned {response.status_code}: {response.content[:200]}")
+        results.append({"users": count, "rebuild_ms": round(rebuild_elapsed * 1000, 3), **summarize(timings)})
+    return results
+
+
+def git_commit():
+    result = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True)
+    return result.stdout.strip() or None
+
+
+def int_list(value):
+    return [int(item) for item in value.split(",") if item]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trades", type=int, default=500, help="Orders per side for buy_stock / sell_stock")
+    parser.add_argument("--orders", type=int_list, default=[1000, 10000, 100000], help="Resting limit-order counts, comma separated")
+    parser.add_argument("--crossing", type=int, default=100, help="Limit orders triggered per matching pass")
+    parser.add_argument("--requests", type=int, default=200, help="place_order requests per order type")
+    parser.add_argument("--holdings", type=int_list, default=[1, 10, 100], help="Symbols held for get_live_prices, comma separated")
+    parser.add_argument("--users", type=int_list, default=[100, 1000, 5000], help="Leaderboard user counts, comma separated")
+    parser.add_argument("--repeat", type=int, default=5, help="Leaderboard requests per user count")
+    parser.add_argument("--db", help="SQLite file to use (default: a temporary file)")
+    parser.add_argument("--output", help="Write the JSON results to this file as well")
+    args = parser.parse_args()
+
+    db_path = args.db or tempfile.mkstemp(prefix="bench-trading-", suffix=".sqlite3")[1]
+    try:
+        # The app prints as it trades; keep stdout for the report
+        with contextlib.redirect_stdout(sys.stderr):
+            setup(db_path)
+            report = {
+                "commit": git_commit(),
+                "buy_sell": bench_buy_sell(args.trades),
+                "limit_orders": [bench_limit_orders(resting, args.crossing) for resting in args.orders],
+                "place_order": bench_place_order(args.requests),
+                "live_prices": bench_live_prices(args.holdings, args.repeat * 4),
+                "leaderboard": bench_leaderboard(args.users, args.repeat),
+            }
+    finally:
+        if not args.db:
+            os.remove(db_path)
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -30,7 +30,16 @@ class MainappConfig(AppConfig):
     name = 'mainapp'
 
     def ready(self):
-        """Flush Redis and reset orders and balance after the app is ready."""
+        """Flush Redis and reset orders and balance after the app is ready, if RESET_ON_STARTUP is set."""
+        from django.conf import settings
+        from django.db.models.signals import post_save
+        from .leaderboard import add_profile
+        post_save.connect(add_profile, sender="mainapp.UserProfile", dispatch_uid="leaderboard_add_profile")
+
+        # Every process that loads the app (web, workers, manage.py commands) runs this
+        if not getattr(settings, "RESET_ON_STARTUP", False):
+            return
+
         try:
             # Flush Redis
             redis_client = redis.from_url(
@@ -0,0 +1,201 @@
+import json
+import os
+import redis
+from django.conf import settings
+from .market_data import to_unix_time
+
+# Redis Connection
+redis_conn = redis.from_url(
+    os.environ.get("REDIS_URL"),
+    decode_responses=True
+)
+
+# Number of candles kept per ticker, the oldest are trimmed as new ones arrive
+CANDLE_HISTORY_WINDOW = getattr(settings, "CANDLE_HISTORY_WINDOW", 1000)
+
+# Rolled-up bar resolutions ({name: seconds}) and bars kept per resolution
+CANDLE_RESOLUTIONS = getattr(settings, "CANDLE_RESOLUTIONS", {"1m": 60, "5m": 300, "1h": 3600, "1d": 86400})
+CANDLE_ROLLUP_WINDOW = getattr(settings, "CANDLE_ROLLUP_WINDOW", 1000)
+
+# Buckets are aligned to Monday 1970-01-05 so weekly bars start on Mondays;
+# the offset is a whole number of days, so shorter resolutions are unaffected.
+BUCKET_ORIGIN = 4 * 86400
+
+# Merges one candle into the open bar of each KEYS[i] list, or starts a new
+# bar when the candle falls in a later bucket; a candle from an earlier
+# bucket is dropped so bars stay in ascending time. Bars are stored as
+# "time,open,high,low,close,volume" so prices keep the exact text the feed
+# wrote instead of going through Lua's float formatting.
+# ARGV: window, then per key: bucket, open, high, low, close, volume
+ROLLUP_SCRIPT = """
+local window = tonumber(ARGV[1])
+for i = 1, #KEYS do
+    local a = 1 + (i - 1) * 6
+    local bucket, open, high, low, close, volume = ARGV[a + 1], ARGV[a + 2], ARGV[a + 3], ARGV[a + 4], ARGV[a + 5], ARGV[a + 6]
+    local last = redis.call('LINDEX', KEYS[i], -1)
+    local bar = nil
+    if last then
+        bar = {}
+        for field in string.gmatch(last, '([^,]+)') do
+            bar[#bar + 1] = field
+        end
+    end
+    if bar and tonumber(bucket) < tonumber(bar[1]) then
+        -- Older than the open bar: skip it
+    elseif bar and bar[1] == bucket then
+        if tonumber(high) > tonumber(bar[3]) then bar[3] = high end
+        if tonumber(low) < tonumber(bar[4]) then bar[4] = low end
+        bar[5] = close
+        bar[6] = string.format('%.0f', tonumber(bar[6]) + tonumber(volume))
+        redis.call('LSET', KEYS[i], -1, table.concat(bar, ','))
+    else
+        redis.call('RPUSH', KEYS[i], table.concat({bucket, open, high, low, close, volume}, ','))
+        redis.call('LTRIM', KEYS[i], -window, -1)
+    end
+end
+return #KEYS
+"""
+_rollup = redis_conn.register_script(ROLLUP_SCRIPT)
+
+
+def candle_key(ticker):
+    return f"candlestick_data:{ticker}"
+
+
+def append_candles(ticker, candles, pipe=None, window=CANDLE_HISTORY_WINDOW):
+    """Append candles to the ticker's history list and trim it to the rolling window.
+
+    Pass a pipeline as `pipe` to batch the write with other commands; it is
+    then up to the caller to execute it.
+    """
+    candles = candles[-window:]  # Anything older would be trimmed straight away
+    if not candles:
+        return
+    client = pipe if pipe is not None else redis_conn.pipeline()
+    key = candle_key(ticker)
+    client.rpush(key, *[json.dumps(candle) for candle in candles])
+    client.ltrim(key, -window, -1)  # Keep only the last `window` candles
+    if pipe is None:
+        client.execute()
+
+
+def append_candle(ticker, candle, pipe=None, window=CANDLE_HISTORY_WINDOW):
+    """Append one candle to the ticker's history, see append_candles."""
+    append_candles(ticker, [candle], pipe=pipe, window=window)
+
+
+def clear_history(ticker, pipe=None):
+    """Drop the ticker's candle history and rolled-up bars, e.g. when the replay starts over."""
+    client = pipe if pipe is not None else redis_conn
+    client.delete(candle_key(ticker), *[bar_key(ticker, resolution) for resolution in CANDLE_RESOLUTIONS])
+
+
+def get_candles(ticker, count=None):
+    """Return the last `count` candles for a ticker (the whole window if None), oldest first."""
+    start = -count if count else 0
+    return [json.loads(candle) for candle in redis_conn.lrange(candle_key(ticker), start, -1)]
+
+
+def _bisect(key, length, value, inclusive):
+    """Binary search the time-ordered list with LINDEX, fetching only O(log n) candles."""
+    lo, hi = 0, length
+    while lo < hi:
+        mid = (lo + hi) // 2
+        time = json.loads(redis_conn.lindex(key, mid))["time"]
+        if time < value or (inclusive and time == value):
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def get_candles_between(ticker, start=None, end=None):
+    """Return candles with start <= time <= end, oldest first.
+
+    Times compare as ISO date strings, the format the feed writes. The feed
+    restarts the history when the replay wraps, so it is always time-ordered;
+    the bounds are found by binary search and only the matching slice is
+    transferred.
+    """
+    key = candle_key(ticker)
+    length = redis_conn.llen(key)
+    if not length:
+        return []
+
+    first = _bisect(key, length, start, inclusive=False) if start else 0
+    last = _bisect(key, length, end, inclusive=True) if end else length
+    if first >= last:
+        return []
+    return [json.loads(candle) for candle in redis_conn.lrange(key, first, last - 1)]
+
+
+def bar_key(ticker, resolution):
+    return f"candle_bars:{resolution}:{ticker}"
+
+
+def bucket_start(timestamp, seconds):
+    """Start (Unix seconds) of the `seconds`-wide bucket containing `timestamp`."""
+    return (timestamp - BUCKET_ORIGIN) // seconds * seconds + BUCKET_ORIGIN
+
+
+def update_rollups(batch, pipe=None, resolutions=None, window=CANDLE_ROLLUP_WINDOW):
+    """Fold {ticker: [candles]} (oldest first) into the rolled-up bars of every resolution.
+
+    Consecutive candles in the same bucket are merged here first, so a bulk
+    fast-forward sends one partial bar per bucket. Runs as a single script
+    call for all tickers and resolutions; pass a pipeline as `pipe` to batch
+    it with the rest of the tick.
+    """
+    resolutions = CANDLE_RESOLUTIONS if resolutions is None else resolutions
+
+    keys = []
+    args = [window]
+    for ticker, candles in batch.items():
+        timestamps = [to_unix_time(candle["time"]) for candle in candles]
+        for resolution, seconds in resolutions.items():
+            bar = None
+            for timestamp, candle in zip(timestamps, candles):
+                bucket = bucket_start(timestamp, seconds)
+                if bar is not None and bar[0] == bucket:
+                    bar[2] = max(bar[2], candle["high"])
+                    bar[3] = min(bar[3], candle["low"])
+                    bar[4] = candle["close"]
+                    bar[5] += int(candle["volume"])
+                    continue
+                if bar is not None:
+                    keys.append(bar_key(ticker, resolution))
+                    args += _bar_args(bar)
+                bar = [bucket, candle["open"], candle["high"], candle["low"], candle["close"], int(candle["volume"])]
+            if bar is not None:
+                keys.append(bar_key(ticker, resolution))
+                args += _bar_args(bar)
+
+    if keys:
+        _rollup(keys=keys, args=args, client=pipe if pipe is not None else redis_conn)
+
+
+def _bar_args(bar):
+    bucket, open, high, low, close, volume = bar
+    return [bucket, repr(float(open)), repr(float(high)), repr(float(low)), repr(float(close)), volume]
+
+
+def parse_bar(bar):
+    time, open, high, low, close, volume = bar.split(",")
+    return {
+        "time": int(time),
+        "open": float(open),
+        "high": float(high),
+        "low": float(low),
+        "close": float(close),
+        "volume": int(float(volume)),
+    }
+
+
+def get_bars(ticker, resolution, count=None):
+    """Return the last `count` rolled-up bars (all kept bars if None), oldest first.
+
+    Bar times are Unix seconds at the start of each bucket.
+    """
+    start = -count if count else 0
+    return [parse_bar(bar) for bar in redis_conn.lrange(bar_key(ticker, resolution), start, -1)]
+
@@ -27,13 +27,13 @@ redis_conn =redis.from_url(
 def fetch_stock_data_from_redis(selected_stock):
     """Fetch latest stock data from Redis."""
     redis_key = f"candlestick_data:{selected_stock}"
-    data = redis_conn.get(redis_key)
+    data = redis_conn.lrange(redis_key, 0, -1)  # history is a capped list of JSON candles
 
     if not data:
         print(f"[WARNING] No data found for stock: {selected_stock}")
         return pd.DataFrame()  # Empty DataFrame
 
-    df = pd.DataFrame(json.loads(data))# Convert to DataFrame bcoz data is in json format
+    df = pd.DataFrame([json.loads(candle) for candle in data])# Convert to DataFrame bcoz data is in json format
 
     # Convert timestamps if necessary
     if isinstance(df["time"].iloc[0], str):
@@ -3,6 +3,7 @@ from channels.generic.websocket import AsyncWebsocketConsumer
 from asgiref.sync import sync_to_async
 import redis
 from urllib.parse import parse_qs
+from .quotes import get_quotes
 import os
 
 # Connect to Redis
@@ -10,6 +11,10 @@ redis_client =redis.from_url(
     os.environ.get("REDIS_URL"),
     decode_responses=True
 )
+
+# Periodic task driving the market replay; it fires every second and the
+# replay rate (mainapp.replay) decides how many ticks are due
+REPLAY_TASK_NAME = "market-replay"
 class StockConsumer(AsyncWebsocketConsumer):
     """Manages stock selection and periodic updates using Celery Beat."""
 
@@ -32,20 +37,23 @@ class StockConsumer(AsyncWebsocketConsumer):
         """Updates or creates a Celery Beat task for fetching stock data."""
         from django_celery_beat.models import PeriodicTask, IntervalSchedule
 
-        task = PeriodicTask.objects.filter(name="every-40-seconds").first()
+        # Superseded by the rate-driven replay and by limit-order checks on each tick
+        PeriodicTask.objects.filter(name__in=["every-40-seconds", "process-limit-orders-every-1-seconds"]).delete()
+
+        task = PeriodicTask.objects.filter(name=REPLAY_TASK_NAME).first()
 
         if task:
             task.args = json.dumps([stockpicker])
             task.save()
         else:
             schedule, _ = IntervalSchedule.objects.get_or_create(
-                every=40, 
+                every=1, 
                 period=IntervalSchedule.SECONDS
             )
             task = PeriodicTask.objects.create(
                 interval=schedule,
-                name="every-40-seconds",
-                task="mainapp.tasks.update_stock",
+                name=REPLAY_TASK_NAME,
+                task="mainapp.tasks.replay_market",
                 args=json.dumps([stockpicker])
             )
 
@@ -122,8 +130,10 @@ class StockConsumer(AsyncWebsocketConsumer):
         await self.add_to_celery_beat(stockpicker)
         await self.add_to_stock_detail(stockpicker, self.user_id)
 
-        # Join room group
+        # Join room group, and the user's own group for queued order results
+        self.user_group_name = f"user_{self.user_id}"
         await self.channel_layer.group_add(self.room_group_name, self.channel_name)
+        await self.channel_layer.group_add(self.user_group_name, self.channel_name)
         await self.accept()
 
     @sync_to_async
@@ -144,7 +154,7 @@ class StockConsumer(AsyncWebsocketConsumer):
                 stock.delete()
 
         # Update Celery Beat task
-        task = PeriodicTask.objects.filter(name="every-40-seconds").first()
+        task = PeriodicTask.objects.filter(name=REPLAY_TASK_NAME).first()
         if task:
             existing_stocks = set(json.loads(task.args)[0])
             user_stocks = set(stocks.values_list("stock", flat=True))
@@ -160,6 +170,8 @@ class StockConsumer(AsyncWebsocketConsumer):
         """Handles WebSocket disconnection."""
         if hasattr(self, 'user_id'):
             await self.remove_user_stocks(self.user_id)
+        if hasattr(self, 'user_group_name'):
+            await self.channel_layer.group_discard(self.user_group_name, self.channel_name)
         await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
 
     async def receive(self, text_data):
@@ -184,12 +196,10 @@ class StockConsumer(AsyncWebsocketConsumer):
             return
 
         user_stocks = await self.select_user_stocks(self.user_id)
-        filtered_message = {}
+        filtered_message = get_quotes(user_stocks)  # Latest quote per stock in one read
 
-        for stock in user_stocks:
-            redis_key = f"candlestick_data:{stock}"
-            data = redis_client.get(redis_key)
-            if data:
-                filtered_message[stock] = json.loads(data)[-1]
+        await self.send(text_data=json.dumps(filtered_message))
 
-        await self.send(text_data=json.dumps(filtered_message))
\ No newline at end of file
+    async def order_result(self, event):
+        """Sends the outcome of a queued order to its owner."""
+        await self.send(text_data=json.dumps({"type": "order_result", **event["message"]}))
@@ -0,0 +1,143 @@
+import json
+from .candle_store import redis_conn, append_candles, clear_history, update_rollups
+from .market_data import get_dataset
+from .leaderboard import mark_prices
+from .quotes import TICK_CHANNEL, TICK_SEQ_KEY, next_tick_seq, make_quote, set_quotes, get_quotes
+
+# Authoritative replay position per ticker ({ticker: next index}), shared by every process
+CURSOR_KEY = "market:cursor"
+
+# Moves every requested ticker forward ARGV[1] candles (wrapping at the end
+# of its series) and reserves as many tick sequence numbers, atomically in
+# one call. Returns the last reserved seq and each ticker's starting index.
+ADVANCE_CURSOR_SCRIPT = """
+local steps = tonumber(ARGV[1])
+local seq = redis.call('INCRBY', KEYS[2], steps)
+local indices = {}
+for i = 2, #ARGV, 2 do
+    local length = tonumber(ARGV[i + 1])
+    local index = tonumber(redis.call('HGET', KEYS[1], ARGV[i]) or '0')
+    if index >= length then
+        index = 0
+    end
+    redis.call('HSET', KEYS[1], ARGV[i], (index + steps) % length)
+    indices[#indices + 1] = index
+end
+return {seq, indices}
+"""
+_advance_cursor = redis_conn.register_script(ADVANCE_CURSOR_SCRIPT)
+
+
+def _advance(tickers, steps):
+    dataset = get_dataset()
+    known = [ticker for ticker in dict.fromkeys(tickers) if ticker in dataset]
+    if not known:
+        return None, {}
+
+    args = [steps]
+    for ticker in known:
+        args += [ticker, len(dataset.get(ticker))]
+    seq, indices = _advance_cursor(keys=[CURSOR_KEY, TICK_SEQ_KEY], args=args)
+
+    return int(seq), {ticker: (dataset.get(ticker), int(index)) for ticker, index in zip(known, indices)}
+
+
+def advance_cursor(tickers):
+    """Advance the shared replay cursor of `tickers` by one candle.
+
+    Only the feed writer should call this. Returns (seq, {ticker: candle});
+    unknown tickers are left out.
+    """
+    seq, starts = _advance(tickers, 1)
+    return seq, {ticker: series.candle(index) for ticker, (series, index) in starts.items()}
+
+
+def advance_cursor_bulk(tickers, steps):
+    """Advance the shared replay cursor of `tickers` by `steps` candles at once.
+
+    Returns (last seq, {ticker: [candles]}) with the candles oldest first.
+    """
+    seq, starts = _advance(tickers, steps)
+    return seq, {ticker: series.candles(index, steps) for ticker, (series, index) in starts.items()}
+
+
+def current_candles(tickers):
+    """Return {ticker: candle} at the shared replay position without moving it.
+
+    Published quotes are used when available so readers see exactly what the
+    feed last sent; tickers the feed has not published yet are read from the
+    dataset at the shared cursor.
+    """
+    data = get_quotes(tickers)
+    missing = [ticker for ticker in dict.fromkeys(tickers) if ticker not in data]
+    if not missing:
+        return data
+
+    dataset = get_dataset()
+    missing = [ticker for ticker in missing if ticker in dataset]
+    if missing:
+        positions = redis_conn.hmget(CURSOR_KEY, missing)
+        for ticker, position in zip(missing, positions):
+            series = dataset.get(ticker)
+            index = (int(position) - 1) % len(series) if position else 0  # cursor holds the *next* index
+            data[ticker] = series.candle(index)
+    return data
+
+
+def series_restart(ticker, candles):
+    """Index of the last candle in `candles` that opens the ticker's dataset series, or None.
+
+    The replay wrapped around to the start of the dataset there.
+    """
+    series = get_dataset().get(ticker)
+    if series is None or not len(series):
+        return None
+    first = series.candle(0)["time"]
+    for index in range(len(candles) - 1, -1, -1):
+        if candles[index]["time"] == first:
+            return index
+    return None
+
+
+def publish_ticks(batch, seq):
+    """Write {ticker: [candles]} (oldest first) as one batch ending at tick `seq`.
+
+    The candle appends, the rolled-up bar updates, the latest-quote update,
+    the leaderboard re-scoring and the tick notification are queued on one
+    MULTI pipeline, so publish latency stays flat as the number of symbols
+    (or fast-forwarded ticks) grows and readers never see half a tick. When
+    the replay wraps to the start of a ticker's series, its history and
+    bars restart there so they stay in ascending time. Returns {ticker: quote}.
+    """
+    batch = {ticker: candles for ticker, candles in batch.items() if candles}
+    if not batch:
+        return {}
+
+    quotes = {ticker: make_quote(candles[-1], seq) for ticker, candles in batch.items()}
+
+    pipe = redis_conn.pipeline(transaction=True)
+    history = {}
+    for ticker, candles in batch.items():
+        restart = series_restart(ticker, candles)
+        if restart is not None:
+            clear_history(ticker, pipe=pipe)
+            candles = candles[restart:]
+        history[ticker] = candles
+        append_candles(ticker, candles, pipe=pipe)
+    update_rollups(history, pipe=pipe)
+    set_quotes(quotes, pipe=pipe)
+    mark_prices({ticker: quote["close"] for ticker, quote in quotes.items()}, pipe=pipe)  # Re-score holders
+    # The quotes ride along so subscribers (the per-process quote cache) need no extra read
+    pipe.publish(TICK_CHANNEL, json.dumps({"seq": seq, "quotes": quotes}))
+    pipe.execute()
+
+    return quotes
+
+
+def publish_tick(candles, seq=None):
+    """Write one feed tick ({ticker: candle}) in a single round-trip, see publish_ticks."""
+    if not candles:
+        return {}
+    if seq is None:
+        seq = next_tick_seq()
+    return publish_ticks({ticker: [candle] for ticker, candle in candles.items()}, seq)
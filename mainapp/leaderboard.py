@@ -0,0 +1,230 @@
+from collections import defaultdict
+from decimal import Decimal
+from .candle_store import redis_conn
+
+# Total profit (realized + unrealized) per username, ranked
+LEADERBOARD_KEY = "leaderboard:scores"
+# The price each ticker's unrealized profit is currently marked at
+LEADERBOARD_PRICES_KEY = "leaderboard:prices"
+# holders:{ticker} hashes map username -> shares held, for re-marking on ticks
+HOLDERS_PREFIX = "leaderboard:holders:"
+
+
+def holders_key(ticker):
+    return f"{HOLDERS_PREFIX}{ticker}"
+
+
+# Applies one fill. With the position marked at price m, buying q shares at P
+# changes the holder's total profit by q * (m - P) and selling by -q * (m - P):
+# realized profit moves by the sale, unrealized by the shares added or removed.
+# Does nothing while the board is not built; the rebuild reads the database.
+# KEYS: scores, prices, holders:{ticker}  ARGV: username, ticker, side, quantity, price
+FILL_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+local username, ticker, side = ARGV[1], ARGV[2], ARGV[3]
+local quantity, price = tonumber(ARGV[4]), tonumber(ARGV[5])
+local mark = tonumber(redis.call('HGET', KEYS[2], ticker))
+if not mark then
+    mark = price
+    redis.call('HSET', KEYS[2], ticker, ARGV[5])
+end
+local delta = quantity * (mark - price)
+if side == 'SELL' then
+    delta = -delta
+    quantity = -quantity
+end
+redis.call('ZINCRBY', KEYS[1], delta, username)
+if redis.call('HINCRBY', KEYS[3], username, quantity) <= 0 then
+    redis.call('HDEL', KEYS[3], username)
+end
+return 1
+"""
+
+# Re-marks moved tickers: every holder's score moves by shares * (new - old).
+# KEYS: scores, prices, then holders:{ticker} per ticker  ARGV: ticker, price per ticker
+MARK_SCRIPT = """
+local built = redis.call('EXISTS', KEYS[1]) == 1
+for i = 1, #ARGV, 2 do
+    local ticker, price = ARGV[i], tonumber(ARGV[i + 1])
+    local old = tonumber(redis.call('HGET', KEYS[2], ticker))
+    redis.call('HSET', KEYS[2], ticker, ARGV[i + 1])
+    if built and old and old ~= price then
+        local holders = redis.call('HGETALL', KEYS[2 + (i + 1) / 2])
+        for j = 1, #holders, 2 do
+            redis.call('ZINCRBY', KEYS[1], tonumber(holders[j + 1]) * (price - old), holders[j])
+        end
+    end
+end
+return 1
+"""
+# Enters a new user at their realized profit, unless the board is not built
+# KEYS: scores  ARGV: username, profit
+ADD_USER_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('ZADD', KEYS[1], 'NX', ARGV[2], ARGV[1])
+end
+return 1
+"""
+# A user's rank and the k users ranked on either side of them, in one call
+# KEYS: scores  ARGV: username, k
+AROUND_SCRIPT = """
+local rank = redis.call('ZREVRANK', KEYS[1], ARGV[1])
+if not rank then
+    return false
+end
+local k = tonumber(ARGV[2])
+local start = math.max(0, rank - k)
+return {rank, start, redis.call('ZREVRANGE', KEYS[1], start, rank + k, 'WITHSCORES')}
+"""
+_fill = redis_conn.register_script(FILL_SCRIPT)
+_mark = redis_conn.register_script(MARK_SCRIPT)
+_add_user = redis_conn.register_script(ADD_USER_SCRIPT)
+_around = redis_conn.register_script(AROUND_SCRIPT)
+
+
+def add_profile(sender, instance, created, **kwargs):
+    """post_save handler for UserProfile: new users appear on the board before their first trade."""
+    if created:
+        username = instance.user.username
+        profit = repr(float(instance.cumulative_profit))
+        try:
+            _add_user(keys=[LEADERBOARD_KEY], args=[username, profit])
+        except Exception as e:
+            print(f"Error adding {username} to the leaderboard: {e}")
+
+
+def record_fill(username, ticker, side, quantity, price):
+    """Apply a committed BUY / SELL fill to the leaderboard."""
+    _fill(
+        keys=[LEADERBOARD_KEY, LEADERBOARD_PRICES_KEY, holders_key(ticker)],
+        args=[username, ticker, side, quantity, repr(float(price))],
+    )
+
+
+def record_fills(fills):
+    """Apply [(username, ticker, side, quantity, price)] fills in one round-trip."""
+    pipe = redis_conn.pipeline()
+    for username, ticker, side, quantity, price in fills:
+        _fill(
+            keys=[LEADERBOARD_KEY, LEADERBOARD_PRICES_KEY, holders_key(ticker)],
+            args=[username, ticker, side, quantity, repr(float(price))],
+            client=pipe,
+        )
+    pipe.execute()
+
+
+def mark_prices(prices, pipe=None):
+    """Re-score the holders of {ticker: price} at the new prices.
+
+    Pass a pipeline as `pipe` to run it with the rest of a feed tick.
+    """
+    if not prices:
+        return
+    keys = [LEADERBOARD_KEY, LEADERBOARD_PRICES_KEY]
+    args = []
+    for ticker, price in prices.items():
+        keys.append(holders_key(ticker))
+        args += [ticker, repr(float(price))]
+    _mark(keys=keys, args=args, client=pipe if pipe is not None else redis_conn)
+
+
+def rebuild_leaderboard(prices=None):
+    """Recompute every score from the database and swap the board in atomically.
+
+    Realized profit comes from UserProfile.cumulative_profit and unrealized
+    profit from a vectorized valuation of all UserStock rows (mainapp.valuation)
+    at `prices` (the latest quotes by default);
+    holdings without a price count at cost until the next rebuild. Fills
+    committed while it reads the database may be missed, so it is meant for
+    a missing board (after a Redis flush) or an explicit resync.
+    """
+    from .models import UserProfile
+    from .quotes import fetch_quotes
+    from .valuation import Holdings, value_portfolios
+
+    if prices is None:
+        # Straight from Redis: the per-process quote cache may trail the marks the feed just set
+        prices = {ticker: Decimal(str(quote["close"])) for ticker, quote in fetch_quotes().items()}
+    holdings = Holdings.load()
+    unrealized = value_portfolios(holdings, prices).unrealized_by_user()
+
+    usernames = {}
+    scores = {}
+    for user_id, username, profit in UserProfile.objects.values_list("user_id", "user__username", "cumulative_profit"):
+        usernames[user_id] = username
+        scores[username] = float(profit) + unrealized.get(user_id, 0.0)
+
+    holders = defaultdict(dict)
+    for user_id, code, quantity in zip(
+        holdings.user_ids.tolist(), holdings.ticker_codes.tolist(), holdings.quantity.tolist()
+    ):
+        username = usernames.get(user_id)
+        if username is not None:
+            ticker = holdings.tickers[code]
+            holders[ticker][username] = holders[ticker].get(username, 0) + int(quantity)
+
+    pipe = redis_conn.pipeline(transaction=True)
+    pipe.delete(LEADERBOARD_KEY, LEADERBOARD_PRICES_KEY, *redis_conn.scan_iter(f"{HOLDERS_PREFIX}*"))
+    if scores:
+        pipe.zadd(LEADERBOARD_KEY, scores)
+    if prices:
+        pipe.hset(LEADERBOARD_PRICES_KEY, mapping={ticker: repr(float(price)) for ticker, price in prices.items()})
+    for ticker, quantities in holders.items():
+        pipe.hset(holders_key(ticker), mapping=quantities)
+    pipe.execute()
+    return len(scores)
+
+
+def ensure_leaderboard():
+    """Build the board if it does not exist yet, e.g. after Redis was flushed."""
+    if redis_conn.exists(LEADERBOARD_KEY):
+        return
+    with redis_conn.lock("leaderboard:rebuild", timeout=60, blocking_timeout=30):
+        if not redis_conn.exists(LEADERBOARD_KEY):
+            rebuild_leaderboard()
+
+
+def _entries(members, first_rank):
+    """[{"rank", "username", "total_profit"}] for (username, score) pairs starting at `first_rank`."""
+    return [
+        {
+            "rank": first_rank + i,
+            "username": username,
+            "total_profit": float(Decimal(repr(float(score))).quantize(Decimal("0.01"))),
+        }
+        for i, (username, score) in enumerate(members)
+    ]
+
+
+def get_leaderboard(offset=0, limit=None):
+    """Return [{"rank", "username", "total_profit"}] ranked by total profit, highest first.
+
+    `offset` and `limit` select a slice of the ranking (all of it by
+    default); ranks start at 1. A slice is one ZREVRANGE, O(log n + limit).
+    """
+    ensure_leaderboard()
+    stop = -1 if limit is None else offset + limit - 1
+    if stop != -1 and stop < offset:
+        return []
+    return _entries(redis_conn.zrevrange(LEADERBOARD_KEY, offset, stop, withscores=True), offset + 1)
+
+
+def leaderboard_size():
+    ensure_leaderboard()
+    return redis_conn.zcard(LEADERBOARD_KEY)
+
+
+def get_around(username, k):
+    """Return (rank, entries) for `username` and the k users on either side, or (None, []).
+
+    O(log n + k) against the sorted set; ranks start at 1.
+    """
+    ensure_leaderboard()
+    around = _around(keys=[LEADERBOARD_KEY], args=[username, k])
+    if not around:
+        return None, []
+    rank, start, flat = around
+    members = list(zip(flat[::2], flat[1::2]))
+    return int(rank) + 1, _entries(members, int(start) + 1)
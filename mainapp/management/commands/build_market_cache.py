@@ -0,0 +1,18 @@
+import os
+from django.core.management.base import BaseCommand, CommandError
+from mainapp.market_data import DATASET_PATHS, MARKET_CACHE_DIR, build_cache
+
+
+class Command(BaseCommand):
+    help = "Convert the market CSV datasets into memory-mappable column files shared by all workers."
+
+    def add_arguments(self, parser):
+        parser.add_argument("csv_files", nargs="*", help="CSV files to convert (defaults to the bundled datasets)")
+        parser.add_argument("--cache-dir", default=MARKET_CACHE_DIR, help="Directory to write the column caches to")
+
+    def handle(self, *args, **options):
+        for csv_path in options["csv_files"] or DATASET_PATHS:
+            if not os.path.exists(csv_path):
+                raise CommandError(f"CSV file not found: {csv_path}")
+            target = build_cache(csv_path, options["cache_dir"])
+            self.stdout.write(self.style.SUCCESS(f"Built market cache for {csv_path} in {target}"))
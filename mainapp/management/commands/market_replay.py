@@ -0,0 +1,35 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from mainapp import replay
+
+
+class Command(BaseCommand):
+    help = "Show or change the market replay speed, pause/resume it, or fast-forward the feed."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rate", type=float, help="Ticks per second for every ticker")
+        parser.add_argument("--pause", action="store_true", help="Stop publishing ticks")
+        parser.add_argument("--resume", action="store_true", help="Resume publishing ticks from now")
+        parser.add_argument("--fast-forward", type=int, metavar="TICKS", help="Apply this many ticks right away in batched writes")
+
+    def handle(self, *args, **options):
+        if options["pause"] and options["resume"]:
+            raise CommandError("Use either --pause or --resume, not both")
+
+        if options["rate"] is not None:
+            try:
+                replay.set_rate(options["rate"])
+            except ValueError as e:
+                raise CommandError(str(e))
+        if options["pause"]:
+            replay.pause()
+        if options["resume"]:
+            replay.resume()
+
+        if options["fast_forward"]:
+            from mainapp.tasks import fast_forward_market
+
+            applied = fast_forward_market(options["fast_forward"])
+            self.stdout.write(self.style.SUCCESS(f"Fast-forwarded {applied} ticks"))
+
+        self.stdout.write(json.dumps(replay.get_state()))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from mainapp.leaderboard import rebuild_leaderboard
+
+
+class Command(BaseCommand):
+    help = "Recompute the Redis leaderboard from the database (it is otherwise kept up to date by fills and ticks)."
+
+    def handle(self, *args, **options):
+        users = rebuild_leaderboard()
+        self.stdout.write(self.style.SUCCESS(f"Leaderboard rebuilt for {users} users"))
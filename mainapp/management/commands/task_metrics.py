@@ -0,0 +1,18 @@
+import json
+from django.core.management.base import BaseCommand
+from mainapp import task_utils
+
+
+class Command(BaseCommand):
+    help = "Show run counts, skipped runs, durations and schedule lag of the guarded background tasks."
+
+    def add_arguments(self, parser):
+        parser.add_argument("names", nargs="*", help="Task names (default: every task with metrics)")
+        parser.add_argument("--reset", action="store_true", help="Clear the metrics after showing them")
+
+    def handle(self, *args, **options):
+        names = options["names"] or None
+        self.stdout.write(json.dumps(task_utils.get_task_metrics(names), indent=2))
+        if options["reset"]:
+            task_utils.reset_task_metrics(names)
+            self.stdout.write(self.style.SUCCESS("Metrics reset"))
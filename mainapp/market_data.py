@@ -0,0 +1,254 @@
+import json
+import os
+import threading
+from datetime import datetime, timezone
+from django.conf import settings
+
+# numpy and pandas are imported inside the functions that need them, so
+# importing this module (and every view that uses it) stays cheap until
+# market data is actually requested.
+
+# Path to CSV file
+CSV_FILE_PATH = os.path.join(
+    settings.BASE_DIR,
+    "mainapp",
+    "multi_stock_data.csv"
+)
+
+# Datasets that `manage.py build_market_cache` converts by default
+DATASET_PATHS = [
+    CSV_FILE_PATH,
+    os.path.join(settings.BASE_DIR, "mainapp", "inferno.csv"),
+]
+
+# Where the memory-mappable column files live, one sub-directory per dataset
+MARKET_CACHE_DIR = getattr(
+    settings,
+    "MARKET_CACHE_DIR",
+    os.path.join(settings.BASE_DIR, "mainapp", "market_cache")
+)
+
+PRICE_COLUMNS = ("open", "high", "low", "close")
+COLUMNS = ("time",) + PRICE_COLUMNS + ("volume",)
+
+
+def to_unix_time(value):
+    """Convert a candle time (ISO date/datetime string, naive means UTC) to Unix seconds."""
+    if isinstance(value, (int, float)):
+        return int(value)
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp())
+
+
+class TickerSeries:
+    """Contiguous OHLCV arrays for one ticker, indexed by replay position."""
+
+    __slots__ = ("ticker", "time", "open", "high", "low", "close", "volume")
+
+    def __init__(self, ticker, time, open, high, low, close, volume):
+        self.ticker = ticker
+        self.time = time
+        self.open = open
+        self.high = high
+        self.low = low
+        self.close = close
+        self.volume = volume
+
+    def __len__(self):
+        return len(self.close)
+
+    def candle(self, index):
+        """Return the candle at `index` in the standardized feed format."""
+        return {
+            "time": str(self.time[index]),  # Ensure this is a string or timestamp
+            "open": float(self.open[index]),
+            "high": float(self.high[index]),
+            "low": float(self.low[index]),
+            "close": float(self.close[index]),
+            "volume": int(self.volume[index]),
+        }
+
+    def candles(self, start, count):
+        """Return `count` consecutive candles from `start`, wrapping at the end of the series."""
+        import numpy as np
+
+        index = (start + np.arange(count)) % len(self)
+        columns = zip(
+            self.time[index].tolist(),
+            self.open[index].tolist(),
+            self.high[index].tolist(),
+            self.low[index].tolist(),
+            self.close[index].tolist(),
+            self.volume[index].tolist(),
+        )
+        return [
+            {"time": str(time), "open": open, "high": high, "low": low, "close": close, "volume": int(volume)}
+            for time, open, high, low, close, volume in columns
+        ]
+
+
+def columnar(df):
+    """Reorder a market CSV DataFrame into ticker-contiguous NumPy columns.
+
+    Returns (columns, bounds) where `columns` maps each name in COLUMNS to an
+    array and `bounds` is [(ticker, start, stop), ...] in order of first
+    appearance in the file, like df["ticker"].unique().
+    """
+    import numpy as np
+    import pandas as pd
+
+    codes, tickers = pd.factorize(df["ticker"])
+    # Stable sort keeps each ticker's rows in file order
+    order = np.argsort(codes, kind="stable")
+
+    columns = {
+        "time": df["date"].to_numpy(dtype=str)[order],
+        "volume": df["volume"].to_numpy(dtype=np.float64)[order],
+    }
+    for column in PRICE_COLUMNS:
+        columns[column] = df[column].to_numpy(dtype=np.float64)[order]
+
+    counts = np.bincount(codes, minlength=len(tickers))
+    stops = np.cumsum(counts)
+    starts = stops - counts
+    bounds = [(str(ticker), int(start), int(stop)) for ticker, start, stop in zip(tickers, starts, stops)]
+    return columns, bounds
+
+
+def cache_path(csv_path, cache_dir=MARKET_CACHE_DIR):
+    """Directory holding the column cache for a CSV dataset."""
+    return os.path.join(cache_dir, os.path.splitext(os.path.basename(csv_path))[0])
+
+
+def build_cache(csv_path, cache_dir=MARKET_CACHE_DIR):
+    """Convert a market CSV into one .npy file per column plus an index.json.
+
+    Returns the cache directory.
+    """
+    import numpy as np
+    import pandas as pd
+
+    columns, bounds = columnar(pd.read_csv(csv_path))
+    target = cache_path(csv_path, cache_dir)
+    os.makedirs(target, exist_ok=True)
+
+    for name in COLUMNS:
+        # Write beside the old file and swap it in, so running workers keep
+        # their existing mapping instead of seeing the file truncated under them
+        path = os.path.join(target, f"{name}.npy")
+        with open(path + ".tmp", "wb") as f:
+            np.save(f, np.ascontiguousarray(columns[name]))
+        os.replace(path + ".tmp", path)
+
+    stat = os.stat(csv_path)
+    index = {
+        "source": os.path.basename(csv_path),
+        "source_size": stat.st_size,
+        "source_mtime": stat.st_mtime,
+        "rows": int(len(columns["close"])),
+        "tickers": bounds,
+    }
+    # Write the index last so a half-built cache is never picked up
+    path = os.path.join(target, "index.json")
+    with open(path + ".tmp", "w") as f:
+        json.dump(index, f)
+    os.replace(path + ".tmp", path)
+    return target
+
+
+def cache_is_fresh(csv_path, cache_dir=MARKET_CACHE_DIR):
+    """True when a cache exists for the CSV and was built from its current contents."""
+    try:
+        with open(os.path.join(cache_path(csv_path, cache_dir), "index.json")) as f:
+            index = json.load(f)
+        stat = os.stat(csv_path)
+    except (OSError, ValueError):
+        return False
+    return index.get("source_size") == stat.st_size and index.get("source_mtime") == stat.st_mtime
+
+
+class MarketDataset:
+    """The replay dataset grouped once per ticker into NumPy arrays."""
+
+    def __init__(self, series):
+        self.series = series  # {ticker: TickerSeries}, in order of first appearance
+        self.tickers = list(series)
+
+    @classmethod
+    def from_columns(cls, columns, bounds):
+        series = {}
+        for ticker, start, stop in bounds:
+            # Slices are views, so memory-mapped columns stay shared between processes
+            series[ticker] = TickerSeries(
+                ticker,
+                **{name: columns[name][start:stop] for name in COLUMNS}
+            )
+        return cls(series)
+
+    @classmethod
+    def from_csv(cls, path=CSV_FILE_PATH):
+        import pandas as pd
+        return cls.from_columns(*columnar(pd.read_csv(path)))
+
+    @classmethod
+    def from_cache(cls, path):
+        """Map a cache built by build_cache read-only, without copying the columns."""
+        import numpy as np
+
+        with open(os.path.join(path, "index.json")) as f:
+            index = json.load(f)
+        columns = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+            for name in COLUMNS
+        }
+        return cls.from_columns(columns, index["tickers"])
+
+    @classmethod
+    def load(cls, csv_path=CSV_FILE_PATH, cache_dir=MARKET_CACHE_DIR):
+        """Use the column cache when it is up to date, otherwise parse the CSV."""
+        if cache_is_fresh(csv_path, cache_dir):
+            return cls.from_cache(cache_path(csv_path, cache_dir))
+        print(f"No up-to-date market cache for {csv_path}, parsing CSV (run manage.py build_market_cache)")
+        return cls.from_csv(csv_path)
+
+    def __contains__(self, ticker):
+        return ticker in self.series
+
+    def get(self, ticker):
+        return self.series.get(ticker)
+
+
+_dataset = None
+_tickers = None
+_lock = threading.Lock()
+
+
+def get_dataset():
+    """Return the shared replay dataset, loading it on first use."""
+    global _dataset
+    if _dataset is None:
+        with _lock:
+            if _dataset is None:
+                _dataset = MarketDataset.load(CSV_FILE_PATH)
+    return _dataset
+
+
+def get_tickers():
+    """Return the dataset's tickers in file order.
+
+    Answered from the cache index when one is available, so listing tickers
+    does not load any columns.
+    """
+    global _tickers
+    if _tickers is None:
+        tickers = None
+        if _dataset is None and cache_is_fresh(CSV_FILE_PATH):
+            try:
+                with open(os.path.join(cache_path(CSV_FILE_PATH), "index.json")) as f:
+                    tickers = [ticker for ticker, _, _ in json.load(f)["tickers"]]
+            except (OSError, ValueError, KeyError):
+                tickers = None
+        _tickers = tickers if tickers is not None else list(get_dataset().tickers)
+    return _tickers
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.6 on 2026-10-18 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainapp', '0015_rename_userstockhistory_transaction'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='limitorder',
+            index=models.Index(fields=['stock', 'order_type', 'price'], name='limitorder_trigger_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='limitorder',
+            index=models.Index(fields=['user', 'created_at'], name='limitorder_user_created_idx'),
+        ),
+    ]
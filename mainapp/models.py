@@ -53,10 +53,34 @@ class LimitOrder(models.Model): # this model is created bcoz we want to store th
     order_type = models.CharField(max_length=4, choices=ORDER_TYPES)
     created_at = models.DateTimeField(auto_now_add=True)  # Add created_at field
 
+    class Meta:
+        indexes = [
+            # Trigger queries: stock=X, order_type=BUY/SELL, price >= / <= market
+            models.Index(fields=['stock', 'order_type', 'price'], name='limitorder_trigger_idx'),
+            # Per-user listing in order history, newest first
+            models.Index(fields=['user', 'created_at'], name='limitorder_user_created_idx'),
+        ]
+
     def __str__(self):
         return f"{self.order_type} {self.quantity} shares of {self.stock} at ${self.price}"
     
     
+class AppliedOrder(models.Model):
+    """An order from the intake queue (mainapp.order_intake) that has been applied.
+
+    Written in the same transaction as the order's fills, so an order is
+    never applied twice, even if the worker died before storing the result
+    in Redis.
+    """
+    order_id = models.CharField(max_length=32, unique=True)  # Id given by submit_order
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    result = models.JSONField()
+    applied_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"Order {self.order_id} for {self.user_id}"
+
+
 class Transaction(models.Model):
     ORDER_TYPES = [
         ('MARKET', 'Market'),
@@ -0,0 +1,154 @@
+import json
+import time
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .candle_store import redis_conn
+from .task_utils import TASK_LOCK_TIMEOUT
+
+# "sync" executes orders inside the place_order request; "queue" acknowledges
+# them with an order id and applies them in batches in the background
+ORDER_INTAKE_MODE = getattr(settings, "ORDER_INTAKE_MODE", "sync")
+# Orders applied per transaction by the queue consumer
+ORDER_INTAKE_BATCH = getattr(settings, "ORDER_INTAKE_BATCH", 200)
+# Seconds an order's status stays available after submission
+ORDER_RESULT_TTL = getattr(settings, "ORDER_RESULT_TTL", 86400)
+
+# Submitted orders, oldest first. Kept across restarts unless RESET_ON_STARTUP
+# flushes Redis, which drops orders not yet applied
+ORDER_QUEUE_KEY = "orders:queue"
+# Orders claimed by the consumer and not yet committed; a run that died
+# leaves them here and the next run applies them first
+ORDER_PROCESSING_KEY = "orders:processing"
+RESULT_PREFIX = "orders:result:"
+
+# Moves up to ARGV[1] orders from the head of the queue to the processing list
+CLAIM_SCRIPT = """
+local orders = redis.call('LRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+if #orders > 0 then
+    redis.call('LTRIM', KEYS[1], #orders, -1)
+    redis.call('RPUSH', KEYS[2], unpack(orders))
+end
+return orders
+"""
+_claim = redis_conn.register_script(CLAIM_SCRIPT)
+
+
+def result_key(order_id):
+    return f"{RESULT_PREFIX}{order_id}"
+
+
+def submit_order(user_id, stock, quantity, action, order_type, price=None):
+    """Queue a validated order and return its id."""
+    order_id = uuid.uuid4().hex
+    order = {
+        "id": order_id,
+        "user_id": user_id,
+        "stock": stock,
+        "quantity": quantity,
+        "action": action,
+        "order_type": order_type,
+        "price": price,
+        "submitted_at": time.time(),
+    }
+    pipe = redis_conn.pipeline()
+    pipe.set(result_key(order_id), json.dumps({"order_id": order_id, "user_id": user_id, "status": "queued"}), ex=ORDER_RESULT_TTL)
+    pipe.rpush(ORDER_QUEUE_KEY, json.dumps(order))
+    pipe.execute()
+    return order_id
+
+
+def has_queued_orders():
+    pipe = redis_conn.pipeline()
+    pipe.llen(ORDER_QUEUE_KEY)
+    pipe.llen(ORDER_PROCESSING_KEY)
+    return any(pipe.execute())
+
+
+def claim_orders(limit=ORDER_INTAKE_BATCH):
+    """Return the next batch of orders, oldest first, moving them to the processing list.
+
+    Orders left in the processing list by a run that died are returned first,
+    minus any whose result was already stored; apply_orders skips those it
+    committed before dying. Only call while holding intake_lock().
+    """
+    leftover = [json.loads(order) for order in redis_conn.lrange(ORDER_PROCESSING_KEY, 0, -1)]
+    if leftover:
+        done = redis_conn.mget([result_key(order["id"]) for order in leftover])
+        pending = [order for order, status in zip(leftover, done) if not status or json.loads(status)["status"] != "done"]
+        if pending:
+            return pending
+        redis_conn.delete(ORDER_PROCESSING_KEY)
+    return [json.loads(order) for order in _claim(keys=[ORDER_QUEUE_KEY, ORDER_PROCESSING_KEY], args=[limit])]
+
+
+def apply_orders(orders, prices):
+    """Execute claimed orders exactly once and return {id: result}.
+
+    Each order is recorded as an AppliedOrder in the same transaction as
+    its fills. Orders a previous run already committed are not executed
+    again; their stored results are returned instead. If two runs overlap,
+    the unique order id makes the second one roll back.
+
+    If the batch fails, its orders are retried one savepoint each; an order
+    that still fails is recorded with an error result so it cannot hold up
+    the orders behind it.
+    """
+    from .models import AppliedOrder
+    from .order_utils import execute_order_batch
+
+    with transaction.atomic():
+        applied = dict(
+            AppliedOrder.objects.filter(order_id__in=[order["id"] for order in orders]).values_list("order_id", "result")
+        )
+        pending = [order for order in orders if order["id"] not in applied]
+        try:
+            with transaction.atomic():
+                results = execute_order_batch(pending, prices) if pending else {}
+        except Exception as e:
+            print(f"Order batch failed, applying its orders one by one: {e}")
+            results = {}
+            for order in pending:
+                try:
+                    with transaction.atomic():
+                        results.update(execute_order_batch([order], prices))
+                except Exception as e:
+                    print(f"Error applying order {order['id']}: {e}")
+                    results[order["id"]] = {"error": "Order could not be applied"}
+        AppliedOrder.objects.bulk_create([
+            AppliedOrder(order_id=order["id"], user_id=order["user_id"], result=results[order["id"]])
+            for order in pending
+        ])
+    results.update(applied)
+    return results
+
+
+def prune_applied_orders(max_age=ORDER_RESULT_TTL):
+    """Delete AppliedOrder rows older than `max_age` seconds, by then no longer retried."""
+    from .models import AppliedOrder
+
+    deleted, _ = AppliedOrder.objects.filter(applied_at__lt=timezone.now() - timedelta(seconds=max_age)).delete()
+    return deleted
+
+
+def complete_orders(orders, results):
+    """Store each order's result and drop the batch from the processing list."""
+    pipe = redis_conn.pipeline()
+    for order in orders:
+        status = {"order_id": order["id"], "user_id": order["user_id"], "status": "done", "result": results[order["id"]]}
+        pipe.set(result_key(order["id"]), json.dumps(status), ex=ORDER_RESULT_TTL)
+    pipe.delete(ORDER_PROCESSING_KEY)
+    pipe.execute()
+
+
+def get_order_status(order_id):
+    """Return {"order_id", "user_id", "status", ["result"]} for a submitted order, or None."""
+    status = redis_conn.get(result_key(order_id))
+    return json.loads(status) if status else None
+
+
+def intake_lock(timeout=TASK_LOCK_TIMEOUT):
+    """Redis lock held by the one consumer applying queued orders."""
+    return redis_conn.lock("orders:intake_lock", timeout=timeout)
@@ -1,69 +1,104 @@
 from decimal import Decimal
-from .models import UserStock, UserProfile, Transaction
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F
+from .models import UserStock, UserProfile, Transaction, LimitOrder
+from .leaderboard import record_fill, record_fills
+from .portfolio import bump_versions
 
 def buy_stock(user, stock_symbol, quantity, price, order_type='MARKET'):
-    """Handle buying stocks - keep original return format but add balance"""
-    user_profile = UserProfile.objects.get(user=user)
+    """Handle buying stocks - keep original return format but add balance
+
+    The balance check and debit are one conditional UPDATE, which also locks
+    the user's profile row until commit. Every order of the same user
+    therefore runs one at a time; the holding row is locked as well before
+    the new average price is computed.
+    """
     total_cost = price * quantity
 
-    if user_profile.balance < total_cost:
-        return {"error": "Insufficient balance"}
-
-    # Deduct balance
-    user_profile.balance -= total_cost
-    user_profile.save()
-
-    # Create transaction record
-    Transaction.objects.create(
-        user=user,
-        stock=stock_symbol,
-        quantity=quantity,
-        price=price,
-        order_type=order_type,
-        action='BUY'
-    )
-
-    # Update or create UserStock
-    user_stock, created = UserStock.objects.get_or_create(
-        user=user,
-        stock=stock_symbol,
-        defaults={"quantity": quantity, "average_price": price, "order_type": order_type}
-    )
-
-    if not created:
-        total_quantity = user_stock.quantity + quantity
-        user_stock.average_price = (
-            (user_stock.average_price * user_stock.quantity) + (price * quantity)
-        ) / total_quantity
-        user_stock.quantity = total_quantity
-        user_stock.order_type = order_type
-        user_stock.save()
+    with transaction.atomic():
+        # Check and deduct balance in one statement
+        debited = UserProfile.objects.filter(user=user, balance__gte=total_cost).update(
+            balance=F("balance") - total_cost
+        )
+        if not debited:
+            UserProfile.objects.get(user=user)  # Raise as before if the profile is missing
+            return {"error": "Insufficient balance"}
+
+        # Update or create UserStock. The average is computed with Decimal here:
+        # in SQL it would be integer division on SQLite for whole-number prices
+        holding = UserStock.objects.select_for_update().filter(user=user, stock=stock_symbol).first()
+        if holding is None:
+            UserStock.objects.create(
+                user=user, stock=stock_symbol, quantity=quantity, average_price=price, order_type=order_type
+            )
+        else:
+            total_quantity = holding.quantity + quantity
+            holding.average_price = ((holding.average_price * holding.quantity) + total_cost) / total_quantity
+            holding.quantity = total_quantity
+            holding.order_type = order_type
+            holding.save(update_fields=["average_price", "quantity", "order_type"])
+
+        # Create transaction record
+        Transaction.objects.create(
+            user=user,
+            stock=stock_symbol,
+            quantity=quantity,
+            price=price,
+            order_type=order_type,
+            action='BUY'
+        )
+        transaction.on_commit(lambda: record_fill(user.username, stock_symbol, 'BUY', quantity, price), robust=True)
+        transaction.on_commit(lambda: bump_versions([user.id]), robust=True)
+
+        balance = UserProfile.objects.filter(user=user).values_list("balance", flat=True).get()
 
     return {
         "success": True,
         "message": "Purchase successful",
-        "balance": float(user_profile.balance),  # Keep original field name
+        "balance": float(balance),  # Keep original field name
         "stock": stock_symbol,  # Maintain all original return fields
         "quantity": quantity,
         "price": float(price)
     }
 
 def sell_stock(user, stock_symbol, quantity, price, order_type='MARKET'):
-    """Handle selling stocks - keep original return format but add balance"""
-    try:
-        user_profile = UserProfile.objects.get(user=user)
-        user_stock = UserStock.objects.get(user=user, stock=stock_symbol)
-        
-        if user_stock.quantity < quantity:
+    """Handle selling stocks - keep original return format but add balance
+
+    The user's profile row is locked first, like buy_stock does, so
+    concurrent orders of the same user cannot interleave between reading
+    the holding and writing it back.
+    """
+    price = Decimal(str(price))
+    quantity_dec = Decimal(str(quantity))
+
+    with transaction.atomic():
+        profile = UserProfile.objects.select_for_update().only("balance", "cumulative_profit").get(user=user)
+        holding = UserStock.objects.filter(user=user, stock=stock_symbol).values_list(
+            "id", "quantity", "average_price"
+        ).first()
+
+        if holding is None:
+            return {"error": "You do not own this stock"}
+        holding_id, held, average_price = holding
+        if held < quantity:
             return {"error": "Insufficient quantity to sell"}
-        
+
         # Calculate profit
-        sale_profit = (Decimal(str(price)) - user_stock.average_price) * Decimal(str(quantity))
-        
+        sale_profit = (price - average_price) * quantity_dec
+
+        # Update holdings
+        if held == quantity:
+            UserStock.objects.filter(id=holding_id).delete()
+        else:
+            UserStock.objects.filter(id=holding_id).update(quantity=F("quantity") - quantity)
+
         # Update profile
-        user_profile.cumulative_profit += sale_profit
-        user_profile.balance += Decimal(str(price)) * Decimal(str(quantity))
-        user_profile.save()
+        profile.cumulative_profit += sale_profit
+        profile.balance += price * quantity_dec
+        UserProfile.objects.filter(id=profile.id).update(
+            balance=profile.balance, cumulative_profit=profile.cumulative_profit
+        )
 
         # Create transaction record
         Transaction.objects.create(
@@ -74,23 +109,292 @@ def sell_stock(user, stock_symbol, quantity, price, order_type='MARKET'):
             order_type=order_type,
             action='SELL'
         )
+        transaction.on_commit(lambda: record_fill(user.username, stock_symbol, 'SELL', quantity, price), robust=True)
+        transaction.on_commit(lambda: bump_versions([user.id]), robust=True)
 
-        # Update holdings
-        if user_stock.quantity == quantity:
-            user_stock.delete()
+    return {
+        "success": True,
+        "message": "Sale successful",
+        "balance": float(profile.balance),  # Keep original field name
+        "cumulative_profit": float(profile.cumulative_profit),
+        "stock": stock_symbol,  # Maintain all original return fields
+        "quantity": quantity,
+        "price": float(price),
+        "sale_profit": float(sale_profit)
+    }
+
+
+def crossed_limit_orders(stock, low, high):
+    """Ids of resting orders on `stock` triggered by a price within [low, high].
+
+    Two range scans on the (stock, order_type, price) index: BUYs with a
+    limit at or above `low`, best price first, then SELLs at or below
+    `high`, best price first; ties in arrival order.
+    """
+    buys = LimitOrder.objects.filter(stock=stock, order_type="BUY", price__gte=low).order_by("-price", "id")
+    sells = LimitOrder.objects.filter(stock=stock, order_type="SELL", price__lte=high).order_by("price", "id")
+    return list(buys.values_list("id", flat=True)) + list(sells.values_list("id", flat=True))
+
+
+def _apply_orders(orders):
+    """Apply market-style fills with bulk writes; call inside transaction.atomic().
+
+    `orders` are dicts with id, user_id, stock, quantity, price (Decimal),
+    action ("BUY" / "SELL") and order_type ("MARKET" / "LIMIT"), applied
+    in the given order with the same rules as buy_stock / sell_stock. The
+    affected profiles and holdings are locked, then Transaction rows are
+    bulk inserted and UserStock / UserProfile rows bulk updated together.
+
+    Returns ({id: result}, [filled ids]) with the same payloads as
+    buy_stock / sell_stock.
+    """
+    results = {}
+    filled = []
+    if not orders:
+        return results, filled
+
+    # Rows are locked in key order, so overlapping batches cannot deadlock
+    user_ids = {order["user_id"] for order in orders}
+    profiles = {
+        profile.user_id: profile
+        for profile in UserProfile.objects.select_for_update().filter(user_id__in=user_ids).order_by("user_id")
+    }
+    holdings = {
+        (holding.user_id, holding.stock): holding
+        for holding in UserStock.objects.select_for_update().filter(
+            user_id__in=user_ids, stock__in={order["stock"] for order in orders}
+        ).order_by("id")
+    }
+
+    new_holdings = {}  # (user_id, stock) -> unsaved UserStock
+    changed_profiles = set()
+    changed_holdings = set()
+    removed_holdings = []  # primary keys of holdings sold down to zero
+    transactions = []
+
+    for order in orders:
+        profile = profiles.get(order["user_id"])
+        if profile is None:
+            results[order["id"]] = {"error": "User profile not found"}
+            continue
+
+        key = (order["user_id"], order["stock"])
+        holding = new_holdings.get(key) or holdings.get(key)
+        price = order["price"]
+        quantity = order["quantity"]
+
+        if order["action"] == "BUY":
+            total_cost = price * quantity
+            if profile.balance < total_cost:
+                results[order["id"]] = {"error": "Insufficient balance"}
+                continue
+
+            profile.balance -= total_cost
+            if holding is None:
+                new_holdings[key] = UserStock(
+                    user_id=order["user_id"], stock=order["stock"],
+                    quantity=quantity, average_price=price, order_type=order["order_type"]
+                )
+            else:
+                total_quantity = holding.quantity + quantity
+                # Rounded as the column stores it, so a later sell in the batch
+                # books the same profit as sell_stock would
+                holding.average_price = (
+                    ((holding.average_price * holding.quantity) + (price * quantity)) / total_quantity
+                ).quantize(Decimal("0.01"))
+                holding.quantity = total_quantity
+                holding.order_type = order["order_type"]
+                if holding.pk:
+                    changed_holdings.add(key)
+
+            results[order["id"]] = {
+                "success": True,
+                "message": "Purchase successful",
+                "balance": float(profile.balance),
+                "stock": order["stock"],
+                "quantity": quantity,
+                "price": float(price)
+            }
+        else:
+            if holding is None:
+                results[order["id"]] = {"error": "You do not own this stock"}
+                continue
+            if holding.quantity < quantity:
+                results[order["id"]] = {"error": "Insufficient quantity to sell"}
+                continue
+
+            sale_profit = (price - holding.average_price) * Decimal(quantity)
+            profile.cumulative_profit += sale_profit
+            profile.balance += price * Decimal(quantity)
+
+            holding.quantity -= quantity
+            if holding.quantity == 0:
+                if holding.pk:
+                    removed_holdings.append(holding.pk)
+                    changed_holdings.discard(key)
+                    del holdings[key]
+                else:
+                    del new_holdings[key]
+            elif holding.pk:
+                changed_holdings.add(key)
+
+            results[order["id"]] = {
+                "success": True,
+                "message": "Sale successful",
+                "balance": float(profile.balance),
+                "cumulative_profit": float(profile.cumulative_profit),
+                "stock": order["stock"],
+                "quantity": quantity,
+                "price": float(price),
+                "sale_profit": float(sale_profit)
+            }
+
+        changed_profiles.add(order["user_id"])
+        filled.append(order["id"])
+        transactions.append(Transaction(
+            user_id=order["user_id"],
+            stock=order["stock"],
+            quantity=quantity,
+            price=price,
+            order_type=order["order_type"],
+            action=order["action"]
+        ))
+
+    if filled:
+        Transaction.objects.bulk_create(transactions)
+        if new_holdings:
+            UserStock.objects.bulk_create(new_holdings.values())
+        if changed_holdings:
+            UserStock.objects.bulk_update(
+                [holdings[key] for key in changed_holdings], ["quantity", "average_price", "order_type"]
+            )
+        if removed_holdings:
+            UserStock.objects.filter(id__in=removed_holdings).delete()
+        UserProfile.objects.bulk_update(
+            [profiles[user_id] for user_id in changed_profiles], ["balance", "cumulative_profit"]
+        )
+
+        usernames = dict(User.objects.filter(id__in=changed_profiles).values_list("id", "username"))
+        fills = [
+            (usernames[fill.user_id], fill.stock, fill.action, fill.quantity, fill.price)
+            for fill in transactions
+        ]
+        transaction.on_commit(lambda: record_fills(fills), robust=True)
+        transaction.on_commit(lambda: bump_versions(changed_profiles), robust=True)
+
+    return results, filled
+
+
+def execute_limit_orders(order_ids):
+    """Fill triggered limit orders in one transaction with bulk writes.
+
+    Orders are locked with SELECT ... FOR UPDATE SKIP LOCKED, so an order
+    already being filled by an overlapping run is skipped instead of filled
+    twice. They are applied in the given order by _apply_orders and the
+    filled ones deleted in the same transaction.
+
+    Returns {order_id: result} for every order that was locked, with the
+    same payloads as buy_stock / sell_stock. Filled orders have "success".
+    """
+    if not order_ids:
+        return {}
+
+    with transaction.atomic():
+        locked = LimitOrder.objects.select_for_update(skip_locked=True).in_bulk(order_ids)
+        orders = []
+        for order_id in order_ids:
+            order = locked.get(order_id)
+            if order is None:
+                continue  # Gone, or being filled by an overlapping run
+            orders.append({
+                "id": order.id,
+                "user_id": order.user_id,
+                "stock": order.stock,
+                "quantity": order.quantity,
+                "price": order.price,
+                "action": order.order_type,
+                "order_type": "LIMIT",
+            })
+        results, filled = _apply_orders(orders)
+        if filled:
+            LimitOrder.objects.filter(id__in=filled).delete()
+
+    return results
+
+
+def execute_order_batch(orders, prices):
+    """Execute a batch of submitted market and limit orders in one transaction.
+
+    `orders` are dicts with id, user_id, stock, quantity, action ("buy" /
+    "sell"), order_type ("market" / "limit") and, for limit orders, price.
+    Market orders fill at `prices` ({ticker: Decimal}, one snapshot for the
+    whole batch) in the given order, so a user's orders apply in sequence;
+    limit orders are stored with one bulk insert.
+
+    Returns {id: result}, results shaped like place_order's responses.
+    """
+    results = {}
+    market = []
+    limits = []
+    for order in orders:
+        price = prices.get(order["stock"])
+        if price is None:
+            results[order["id"]] = {"error": "No data found for the selected stock"}
+        elif order["order_type"] == "market":
+            market.append({
+                "id": order["id"],
+                "user_id": order["user_id"],
+                "stock": order["stock"],
+                "quantity": order["quantity"],
+                "price": price,
+                "action": order["action"].upper(),
+                "order_type": "MARKET",
+            })
         else:
-            user_stock.quantity -= quantity
-            user_stock.save()
-
-        return {
-            "success": True,
-            "message": "Sale successful",
-            "balance": float(user_profile.balance),  # Keep original field name
-            "cumulative_profit": float(user_profile.cumulative_profit),
-            "stock": stock_symbol,  # Maintain all original return fields
-            "quantity": quantity,
-            "price": float(price),
-            "sale_profit": float(sale_profit)
-        }
-    except UserStock.DoesNotExist:
-        return {"error": "You do not own this stock"}
\ No newline at end of file
+            limits.append(order)
+
+    with transaction.atomic():
+        filled_results, _ = _apply_orders(market)
+        results.update(filled_results)
+
+        if limits:
+            LimitOrder.objects.bulk_create([
+                LimitOrder(
+                    user_id=order["user_id"],
+                    stock=order["stock"],
+                    quantity=order["quantity"],
+                    price=Decimal(str(order["price"])),
+                    order_type=order["action"].upper(),
+                )
+                for order in limits
+            ])
+            balances = dict(
+                UserProfile.objects.filter(user_id__in={order["user_id"] for order in limits})
+                .values_list("user_id", "balance")
+            )
+            for order in limits:
+                results[order["id"]] = {
+                    "success": True,
+                    "message": f"Limit order placed for {order['quantity']} shares of {order['stock']} at ${Decimal(str(order['price']))}",
+                    "balance": float(balances.get(order["user_id"], 0)),
+                }
+
+    return results
+
+
+def marketable_limit_ranges(orders, results, prices):
+    """{ticker: (price, price)} for newly placed limit orders the snapshot `prices` already crosses.
+
+    Fed to process_limit_orders so they fill right away instead of on the
+    next price move.
+    """
+    ranges = {}
+    for order in orders:
+        result = results.get(order["id"])
+        if order["order_type"] != "limit" or not result or "error" in result:
+            continue
+        price = prices[order["stock"]]
+        limit = Decimal(str(order["price"]))
+        if (order["action"] == "buy" and price <= limit) or (order["action"] != "buy" and price >= limit):
+            ranges[order["stock"]] = (price, price)
+    return ranges
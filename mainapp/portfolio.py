@@ -0,0 +1,104 @@
+import json
+import uuid
+from decimal import Decimal
+from django.conf import settings
+from .candle_store import redis_conn
+from .quotes import TICK_SEQ_KEY, get_quote_snapshot
+
+# Seconds a user's portfolio snapshot is kept after it was last built
+PORTFOLIO_SNAPSHOT_TTL = getattr(settings, "PORTFOLIO_SNAPSHOT_TTL", 300)
+
+# Random token renewed whenever Redis is flushed (e.g. RESET_ON_STARTUP), so tick
+# seqs and versions that restart from zero never repeat an old ETag
+EPOCH_KEY = "portfolio:epoch"
+# Per-user counter bumped on every committed trade
+VERSION_PREFIX = "portfolio:version:"
+SNAPSHOT_PREFIX = "portfolio:snapshot:"
+
+
+def version_key(user_id):
+    return f"{VERSION_PREFIX}{user_id}"
+
+
+def snapshot_key(user_id):
+    return f"{SNAPSHOT_PREFIX}{user_id}"
+
+
+def bump_versions(user_ids):
+    """Invalidate the snapshots of users whose positions or balance changed."""
+    pipe = redis_conn.pipeline()
+    for user_id in set(user_ids):
+        pipe.incr(version_key(user_id))
+    pipe.execute()
+
+
+def snapshot_state(user_id):
+    """Return (epoch, tick seq, version) for a user in one round-trip.
+
+    Together they identify the user's portfolio: prices change with the
+    tick seq, positions and balance with the version.
+    """
+    epoch, seq, version = redis_conn.mget(EPOCH_KEY, TICK_SEQ_KEY, version_key(user_id))
+    if epoch is None:
+        redis_conn.set(EPOCH_KEY, uuid.uuid4().hex[:12], nx=True)
+        epoch = redis_conn.get(EPOCH_KEY)
+    return epoch, int(seq or 0), int(version or 0)
+
+
+def value_positions(user_stocks, quotes):
+    """{ticker: position} with live value and profit/loss of UserStock rows at `quotes`."""
+    positions = {}
+    for stock in user_stocks:
+        latest_data = quotes.get(stock.stock)
+        if not latest_data:
+            continue
+
+        current_price = Decimal(latest_data["close"])
+        average_price = stock.average_price
+
+        # Calculate profit/loss
+        profit_loss = (current_price - average_price) * stock.quantity
+        profit_loss_percentage = ((current_price - average_price) / average_price) * 100
+
+        positions[stock.stock] = {
+            "quantity": stock.quantity,
+            "average_price": float(average_price),
+            "live_price": latest_data["close"],
+            "total_value": float(stock.quantity * latest_data["close"]),
+            "profit_loss": float(profit_loss),  # Total profit/loss in currency
+            "profit_loss_percentage": float(profit_loss_percentage),  # Profit/loss percentage
+        }
+    return positions
+
+
+def get_snapshot(user, state=None, match_seq=True):
+    """Return the user's portfolio snapshot {"balance", "positions", ...}.
+
+    Served from Redis while it was built at the current tick seq and trade
+    version (any seq with match_seq=False, for balance-only reads),
+    otherwise rebuilt from the database and one quote snapshot. Pass the
+    `state` from snapshot_state() if it was already read.
+    """
+    from .models import UserProfile, UserStock
+
+    epoch, seq, version = state or snapshot_state(user.id)
+    cached = redis_conn.get(snapshot_key(user.id))
+    if cached:
+        snapshot = json.loads(cached)
+        if snapshot["epoch"] == epoch and snapshot["version"] == version and (not match_seq or snapshot["seq"] == seq):
+            return snapshot
+
+    # The state was read first, so a trade committing meanwhile bumps the
+    # version past this snapshot and the next read rebuilds it
+    profile, _ = UserProfile.objects.get_or_create(user=user)
+    user_stocks = list(UserStock.objects.filter(user=user))
+    quotes = get_quote_snapshot([stock.stock for stock in user_stocks], min_seq=seq)
+    snapshot = {
+        "epoch": epoch,
+        "seq": seq,
+        "version": version,
+        "balance": float(profile.balance),
+        "positions": value_positions(user_stocks, quotes),
+    }
+    redis_conn.set(snapshot_key(user.id), json.dumps(snapshot), ex=PORTFOLIO_SNAPSHOT_TTL)
+    return snapshot
@@ -0,0 +1,204 @@
+import json
+import os
+import threading
+import time
+import redis
+from collections import OrderedDict
+from decimal import Decimal
+from django.conf import settings
+
+# Redis Connection
+redis_conn = redis.from_url(
+    os.environ.get("REDIS_URL"),
+    decode_responses=True
+)
+
+# One hash holds the latest quote of every ticker, so any set of tickers is a single read
+QUOTES_KEY = "market:quotes"
+# Incremented once per feed tick, lets readers tell whether prices moved
+TICK_SEQ_KEY = "market:tick_seq"
+# Pub/sub channel the feed notifies after every tick
+TICK_CHANNEL = "market:ticks"
+
+
+def next_tick_seq():
+    """Reserve the sequence number for a new feed tick."""
+    return redis_conn.incr(TICK_SEQ_KEY)
+
+
+def make_quote(candle, seq):
+    """Build the compact latest-quote record for a candle published at tick `seq`."""
+    return {
+        "time": candle["time"],
+        "open": candle["open"],
+        "high": candle["high"],
+        "low": candle["low"],
+        "close": candle["close"],
+        "volume": candle["volume"],
+        "seq": seq,
+        "ts": time.time(),
+    }
+
+
+def set_quotes(quotes, pipe=None):
+    """Store {ticker: quote} as the latest quotes. Batched into `pipe` if given."""
+    if not quotes:
+        return
+    client = pipe if pipe is not None else redis_conn
+    client.hset(QUOTES_KEY, mapping={ticker: json.dumps(quote) for ticker, quote in quotes.items()})
+
+
+def fetch_quotes(tickers=None):
+    """Read {ticker: quote} straight from Redis in one round-trip, bypassing the cache.
+
+    Tickers without a quote yet are left out.
+    """
+    if tickers is None:
+        return {ticker: json.loads(quote) for ticker, quote in redis_conn.hgetall(QUOTES_KEY).items()}
+
+    tickers = list(dict.fromkeys(tickers))
+    if not tickers:
+        return {}
+    values = redis_conn.hmget(QUOTES_KEY, tickers)
+    return {ticker: json.loads(quote) for ticker, quote in zip(tickers, values) if quote}
+
+
+class QuoteCache:
+    """Per-process cache of the latest quotes, pushed by the feed's tick notifications.
+
+    A background thread subscribes to TICK_CHANNEL and stores the quotes that
+    come with every tick, so reads are served from memory. Pub/sub does not
+    redeliver missed messages, so an entry older than `max_age` seconds (or
+    any entry while the subscription is down) is re-read from Redis. At most
+    `max_size` tickers are kept, least recently used first out.
+    """
+
+    def __init__(self, max_size=1024, max_age=60):
+        self.max_size = max_size
+        self.max_age = max_age
+        self._entries = OrderedDict()  # ticker -> (quote, stored_at)
+        self._all_at = None  # when every ticker was last loaded, for get_quotes(None)
+        self._lock = threading.Lock()
+        self._pid = None
+        self._connected = False
+
+    def _ensure_listener(self):
+        # Threads do not survive fork (Celery prefork, Daphne workers), so
+        # each process starts its own subscriber and cache on first use.
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._entries.clear()
+            self._all_at = None
+            self._connected = False
+            threading.Thread(target=self._listen, name="quote-cache", daemon=True).start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = redis_conn.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(TICK_CHANNEL)
+                self._connected = True
+                for message in pubsub.listen():
+                    tick = json.loads(message["data"])
+                    self.store(tick.get("quotes", {}))
+            except Exception as e:
+                print(f"Quote cache subscription error: {e}")
+            # Anything cached may have missed ticks while disconnected
+            self._connected = False
+            self.clear()
+            time.sleep(1)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._all_at = None
+
+    def store(self, quotes, now=None):
+        """Cache {ticker: quote}, never replacing a newer quote with an older one."""
+        now = time.time() if now is None else now
+        with self._lock:
+            for ticker, quote in quotes.items():
+                cached = self._entries.get(ticker)
+                if cached is not None and cached[0].get("seq", 0) > quote.get("seq", 0):
+                    continue
+                self._entries[ticker] = (quote, now)
+                self._entries.move_to_end(ticker)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._all_at = None
+
+    def get_quotes(self, tickers=None):
+        """Return {ticker: quote} like fetch_quotes, from memory where fresh."""
+        self._ensure_listener()
+        now = time.time()
+
+        if tickers is None:
+            with self._lock:
+                if self._connected and self._all_at is not None and now - self._all_at <= self.max_age:
+                    return {ticker: quote for ticker, (quote, _) in self._entries.items()}
+            quotes = fetch_quotes()
+            self.store(quotes, now)
+            with self._lock:
+                if len(quotes) <= self.max_size:
+                    self._all_at = now
+            return quotes
+
+        result = {}
+        missing = []
+        with self._lock:
+            for ticker in dict.fromkeys(tickers):
+                cached = self._entries.get(ticker)
+                if cached is not None and self._connected and now - cached[1] <= self.max_age:
+                    self._entries.move_to_end(ticker)
+                    result[ticker] = cached[0]
+                else:
+                    missing.append(ticker)
+
+        if missing:
+            fetched = fetch_quotes(missing)
+            self.store(fetched, now)
+            result.update(fetched)
+        return result
+
+
+quote_cache = QuoteCache(
+    max_size=getattr(settings, "QUOTE_CACHE_SIZE", 1024),
+    max_age=getattr(settings, "QUOTE_CACHE_MAX_AGE", 60),
+)
+
+
+def get_quotes(tickers=None):
+    """Return {ticker: quote} for `tickers` (all tickers if None).
+
+    Served from the per-process quote cache, falling back to one Redis
+    round-trip for anything missing or stale. Tickers without a quote yet
+    are left out.
+    """
+    return quote_cache.get_quotes(tickers)
+
+
+def get_quote_snapshot(tickers, min_seq=0):
+    """Return {ticker: quote} for `tickers`, all from one tick no older than `min_seq`.
+
+    Served from the quote cache when it holds such a set (the feed pushes
+    every ticker of a tick together), otherwise re-read in one HMGET.
+    """
+    quotes = get_quotes(tickers)
+    seqs = {quote.get("seq", 0) for quote in quotes.values()}
+    if len(seqs) > 1 or (seqs and min(seqs) < min_seq):
+        quotes = fetch_quotes(tickers)
+    return quotes
+
+
+def get_quote(ticker):
+    """Return the latest quote for a ticker, or None if the feed has not published it."""
+    return get_quotes([ticker]).get(ticker)
+
+
+def get_prices(tickers=None):
+    """Return {ticker: Decimal close} for `tickers` in at most one round-trip."""
+    return {ticker: Decimal(quote["close"]) for ticker, quote in get_quotes(tickers).items()}
@@ -0,0 +1,75 @@
+import time
+from django.conf import settings
+from .candle_store import redis_conn
+
+# Replay controls shared by every process: rate, paused flag and the time the
+# last due tick was accounted for
+REPLAY_KEY = "market:replay"
+
+# Ticks per second per ticker; the default matches the old 40-second beat
+MARKET_REPLAY_RATE = getattr(settings, "MARKET_REPLAY_RATE", 1 / 40)
+# Most ticks one replay run applies; a larger backlog (e.g. after downtime) is dropped
+MARKET_REPLAY_MAX_STEPS = getattr(settings, "MARKET_REPLAY_MAX_STEPS", 1000)
+
+# Works out how many ticks are due since the last run at the current rate and
+# moves the clock forward by exactly that many tick intervals, so fractional
+# progress carries over to the next run. The first run emits one tick.
+DUE_STEPS_SCRIPT = """
+local state = redis.call('HMGET', KEYS[1], 'rate', 'paused', 'last_tick_at')
+local now = tonumber(ARGV[1])
+local rate = tonumber(state[1]) or tonumber(ARGV[2])
+local max_steps = tonumber(ARGV[3])
+local last = tonumber(state[3])
+if state[2] == '1' or rate <= 0 then
+    redis.call('HSET', KEYS[1], 'last_tick_at', ARGV[1])
+    return 0
+end
+if not last then
+    redis.call('HSET', KEYS[1], 'last_tick_at', ARGV[1])
+    return 1
+end
+local steps = math.floor((now - last) * rate)
+if steps <= 0 then
+    return 0
+end
+if steps > max_steps then
+    steps = max_steps
+    redis.call('HSET', KEYS[1], 'last_tick_at', ARGV[1])
+else
+    redis.call('HSET', KEYS[1], 'last_tick_at', string.format('%.6f', last + steps / rate))
+end
+return steps
+"""
+_due_steps = redis_conn.register_script(DUE_STEPS_SCRIPT)
+
+
+def get_state():
+    """Return the replay controls as {"rate", "paused", "last_tick_at"}."""
+    rate, paused, last_tick_at = redis_conn.hmget(REPLAY_KEY, "rate", "paused", "last_tick_at")
+    return {
+        "rate": float(rate) if rate else MARKET_REPLAY_RATE,
+        "paused": paused == "1",
+        "last_tick_at": float(last_tick_at) if last_tick_at else None,
+    }
+
+
+def set_rate(rate):
+    """Set the replay speed in ticks per second (0 stops the clock like pause)."""
+    if rate < 0:
+        raise ValueError("Replay rate must not be negative")
+    redis_conn.hset(REPLAY_KEY, "rate", repr(float(rate)))
+
+
+def pause():
+    redis_conn.hset(REPLAY_KEY, "paused", "1")
+
+
+def resume():
+    """Resume from now, without replaying the ticks missed while paused."""
+    redis_conn.hset(REPLAY_KEY, mapping={"paused": "0", "last_tick_at": "%.6f" % time.time()})
+
+
+def due_steps(now=None):
+    """Return how many ticks the replay should apply now, and consume them."""
+    now = time.time() if now is None else now
+    return int(_due_steps(keys=[REPLAY_KEY], args=["%.6f" % now, repr(float(MARKET_REPLAY_RATE)), MARKET_REPLAY_MAX_STEPS]))
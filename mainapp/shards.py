@@ -0,0 +1,96 @@
+import time
+import zlib
+from django.conf import settings
+from .candle_store import redis_conn
+
+# Limit-order matching is partitioned by ticker into this many shards, each
+# processed by its own task so matching spreads over the Celery workers
+LIMIT_ORDER_SHARDS = getattr(settings, "LIMIT_ORDER_SHARDS", 4)
+# Optional {ticker: shard} overrides, e.g. to give a busy symbol a shard of its own
+LIMIT_ORDER_SHARD_MAP = getattr(settings, "LIMIT_ORDER_SHARD_MAP", {})
+# When set, shard N is routed to the queue "<prefix>N" so dedicated workers
+# (celery worker -Q limit_orders.0,...) can own shards; otherwise the default queue
+LIMIT_ORDER_QUEUE_PREFIX = getattr(settings, "LIMIT_ORDER_QUEUE_PREFIX", "")
+# Seconds a shard lock is held at most, in case its worker dies mid-run
+LIMIT_ORDER_LOCK_TIMEOUT = getattr(settings, "LIMIT_ORDER_LOCK_TIMEOUT", 30)
+
+
+def shard_for(ticker, shards=None):
+    """Return the shard a ticker is matched on."""
+    shards = LIMIT_ORDER_SHARDS if shards is None else shards
+    if ticker in LIMIT_ORDER_SHARD_MAP:
+        return LIMIT_ORDER_SHARD_MAP[ticker] % shards
+    # crc32 is stable across processes, unlike hash() on str
+    return zlib.crc32(ticker.encode()) % shards
+
+
+def split_by_shard(price_ranges, shards=None):
+    """Group {ticker: (low, high)} into {shard: {ticker: (low, high)}}."""
+    grouped = {}
+    for ticker, price_range in price_ranges.items():
+        grouped.setdefault(shard_for(ticker, shards), {})[ticker] = price_range
+    return grouped
+
+
+def shard_queue(shard):
+    """Celery queue for a shard's tasks, or None for the default queue."""
+    return f"{LIMIT_ORDER_QUEUE_PREFIX}{shard}" if LIMIT_ORDER_QUEUE_PREFIX else None
+
+
+# Price ranges waiting to be matched per shard, as {ticker: "low,high"} plus
+# "_since", when the oldest of them was queued
+PENDING_PREFIX = "limit_orders:pending:"
+
+# Widens each ticker's queued range with the new one, so any number of ticks
+# arriving while a shard is busy collapse into a single range per ticker.
+# ARGV: now, then ticker, low, high per ticker
+MERGE_PENDING_SCRIPT = """
+redis.call('HSETNX', KEYS[1], '_since', ARGV[1])
+for i = 2, #ARGV, 3 do
+    local ticker, low, high = ARGV[i], ARGV[i + 1], ARGV[i + 2]
+    local queued = redis.call('HGET', KEYS[1], ticker)
+    if queued then
+        local qlow, qhigh = string.match(queued, '([^,]+),([^,]+)')
+        if tonumber(qlow) < tonumber(low) then low = qlow end
+        if tonumber(qhigh) > tonumber(high) then high = qhigh end
+    end
+    redis.call('HSET', KEYS[1], ticker, low .. ',' .. high)
+end
+return 1
+"""
+_merge_pending = redis_conn.register_script(MERGE_PENDING_SCRIPT)
+
+
+def pending_key(shard):
+    return f"{PENDING_PREFIX}{shard}"
+
+
+def queue_ranges(shard, price_ranges, now=None):
+    """Add {ticker: (low, high)} to the shard's pending ranges."""
+    args = [time.time() if now is None else now]
+    for ticker, (low, high) in price_ranges.items():
+        args += [ticker, str(low), str(high)]
+    _merge_pending(keys=[pending_key(shard)], args=args)
+
+
+def has_pending_ranges(shard):
+    return bool(redis_conn.exists(pending_key(shard)))
+
+
+def take_ranges(shard):
+    """Atomically remove and return (queued_at, {ticker: (low, high)}) for a shard.
+
+    queued_at is None when nothing was pending.
+    """
+    pipe = redis_conn.pipeline()
+    pipe.hgetall(pending_key(shard))
+    pipe.delete(pending_key(shard))
+    pending = pipe.execute()[0]
+    since = pending.pop("_since", None)
+    ranges = {ticker: tuple(value.split(",")) for ticker, value in pending.items()}
+    return (float(since) if since else None), ranges
+
+
+def shard_lock(shard, timeout=LIMIT_ORDER_LOCK_TIMEOUT):
+    """Redis lock held while a shard is matched, so a ticker never runs on two workers at once."""
+    return redis_conn.lock(f"limit_orders:shard:{shard}", timeout=timeout)
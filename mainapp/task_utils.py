@@ -0,0 +1,121 @@
+import functools
+import time
+from django.conf import settings
+from redis.exceptions import LockError
+from .candle_store import redis_conn
+
+# Seconds a single-flight lock is held at most, in case its worker dies mid-run
+TASK_LOCK_TIMEOUT = getattr(settings, "TASK_LOCK_TIMEOUT", 60)
+
+# One hash of counters and timings per task, see record_run
+METRICS_PREFIX = "task_metrics:"
+
+# Counts the run and keeps last/max/total duration and lag in the task's hash.
+# ARGV: now, duration, lag ('' when unknown)
+RECORD_RUN_SCRIPT = """
+local now, duration, lag = ARGV[1], tonumber(ARGV[2]), ARGV[3]
+redis.call('HINCRBY', KEYS[1], 'runs', 1)
+redis.call('HINCRBYFLOAT', KEYS[1], 'total_duration', duration)
+redis.call('HSET', KEYS[1], 'last_duration', ARGV[2], 'last_run_at', now)
+if duration > (tonumber(redis.call('HGET', KEYS[1], 'max_duration')) or -1) then
+    redis.call('HSET', KEYS[1], 'max_duration', ARGV[2])
+end
+if lag ~= '' then
+    redis.call('HSET', KEYS[1], 'last_lag', lag)
+    if tonumber(lag) > (tonumber(redis.call('HGET', KEYS[1], 'max_lag')) or -1) then
+        redis.call('HSET', KEYS[1], 'max_lag', lag)
+    end
+end
+return 1
+"""
+_record_run = redis_conn.register_script(RECORD_RUN_SCRIPT)
+
+
+def metrics_key(name):
+    return f"{METRICS_PREFIX}{name}"
+
+
+def record_run(name, duration, lag=None):
+    """Record one completed run of task `name`, `lag` being how late it started in seconds."""
+    lag = "" if lag is None else "%.6f" % max(lag, 0)
+    _record_run(keys=[metrics_key(name)], args=[time.time(), "%.6f" % duration, lag])
+
+
+def record_skip(name):
+    """Record a run of task `name` that was skipped because another one was in flight."""
+    redis_conn.hincrby(metrics_key(name), "skipped", 1)
+
+
+def record_failure(name):
+    redis_conn.hincrby(metrics_key(name), "failures", 1)
+
+
+def get_task_metrics(names=None):
+    """Return {task name: metrics} for `names`, or every task that recorded any."""
+    if names is None:
+        names = sorted(key[len(METRICS_PREFIX):] for key in redis_conn.scan_iter(f"{METRICS_PREFIX}*"))
+    pipe = redis_conn.pipeline()
+    for name in names:
+        pipe.hgetall(metrics_key(name))
+    metrics = {}
+    for name, values in zip(names, pipe.execute()):
+        runs = int(values.get("runs", 0))
+        metrics[name] = {
+            "runs": runs,
+            "skipped": int(values.get("skipped", 0)),
+            "failures": int(values.get("failures", 0)),
+            "last_run_at": float(values["last_run_at"]) if "last_run_at" in values else None,
+            "last_duration": float(values.get("last_duration", 0)),
+            "max_duration": float(values.get("max_duration", 0)),
+            "avg_duration": float(values.get("total_duration", 0)) / runs if runs else 0.0,
+            "last_lag": float(values.get("last_lag", 0)),
+            "max_lag": float(values.get("max_lag", 0)),
+        }
+    return metrics
+
+
+def reset_task_metrics(names=None):
+    keys = list(redis_conn.scan_iter(f"{METRICS_PREFIX}*")) if names is None else [metrics_key(name) for name in names]
+    if keys:
+        redis_conn.delete(*keys)
+
+
+def release(lock, name):
+    try:
+        lock.release()
+    except LockError:
+        print(f"Lock for {name} expired before the run finished")
+
+
+def single_flight(name, interval=None, timeout=TASK_LOCK_TIMEOUT):
+    """Run the decorated task at most once at a time across all workers.
+
+    A run that finds another one in flight is skipped (it returns None) and
+    counted. Every run records its duration in the task's metrics hash; with
+    `interval` (the schedule period in seconds) the lag is how much later
+    than one interval after the previous run it started.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            lock = redis_conn.lock(f"single_flight:{name}", timeout=timeout)
+            if not lock.acquire(blocking=False):
+                record_skip(name)
+                return None
+
+            started = time.time()
+            lag = None
+            if interval is not None:
+                previous = redis_conn.getset(f"single_flight:{name}:started_at", started)
+                if previous is not None:
+                    lag = started - float(previous) - interval
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                record_failure(name)
+                raise
+            finally:
+                record_run(name, time.time() - started, lag)
+                release(lock, name)
+        return wrapper
+    return decorator
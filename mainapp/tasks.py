@@ -1,79 +1,76 @@
 from celery import shared_task
-import pandas as pd
-import json
-import redis
 from channels.layers import get_channel_layer
 import asyncio
-from mainapp.models import StockDetail,LimitOrder
+from mainapp.models import StockDetail
 from decimal import Decimal
-from .order_utils import buy_stock, sell_stock 
-import os
+from .order_utils import crossed_limit_orders, execute_limit_orders, marketable_limit_ranges
+from .order_intake import apply_orders, claim_orders, complete_orders, has_queued_orders, intake_lock, prune_applied_orders
+from .feed import advance_cursor, advance_cursor_bulk, publish_tick, publish_ticks
+from .replay import due_steps
+from .shards import has_pending_ranges, queue_ranges, shard_lock, shard_queue, split_by_shard, take_ranges
+from .task_utils import record_failure, record_run, record_skip, release, single_flight
+from .quotes import fetch_quotes, get_prices
+import time
 from django.conf import settings
 
-# Redis Connection
+# Tickers the feed publishes
+MARKET_TICKERS = getattr(settings, "MARKET_TICKERS", ['MSFT','AAPL','GOOGL','AMZN','TSLA','NVDA','NFLX','META'])
+# Ticks written per round-trip when fast-forwarding
+MARKET_REPLAY_BATCH = getattr(settings, "MARKET_REPLAY_BATCH", 500)
 
+def fetch_stock_data_from_csv(selected_stocks):
+    """Fetch stock data from CSV and store in Redis in a standardized format.
 
-redis_conn = redis.from_url(
-    os.environ.get("REDIS_URL"),
-    decode_responses=True
-)
+    Limit orders are then evaluated for the tickers whose price moved.
+    """
+    seq, data = advance_cursor(selected_stocks)  # Shared cursor, advanced atomically in Redis
+    if not data:
+        print("No data found for stocks:", selected_stocks)
+        return data
 
-CSV_FILE_PATH = os.path.join(
-    settings.BASE_DIR,
-    "mainapp",
-    "multi_stock_data.csv"
-)
-# Path to CSV file
-df = pd.read_csv(CSV_FILE_PATH)
+    # Straight from Redis: the per-process quote cache may trail the last published tick
+    previous = fetch_quotes(list(data))
+    publish_tick(data, seq)  # All tickers, quotes and the tick notification in one round-trip
 
-# Track index for each stock
-stock_indices = {ticker: 0 for ticker in df["ticker"].unique()}
+    moved = {
+        ticker: (candle["close"], candle["close"])
+        for ticker, candle in data.items()
+        if ticker not in previous or previous[ticker]["close"] != candle["close"]
+    }
+    if moved:
+        process_limit_orders(moved)
+    return data
 
-def fetch_stock_data_from_csv(selected_stocks):
-    """Fetch stock data from CSV and store in Redis in a standardized format."""
-    global stock_indices
-    data = {}
+def broadcast_stock_update(data):
+    """Send the latest candles to the WebSocket group."""
+    channel_layer = get_channel_layer()
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.run_until_complete(channel_layer.group_send("stock_track", {
+        "type": "send_stock_update",
+        "message": data,
+    }))
+    loop.close()
 
-    for ticker in selected_stocks:
-        stock_data = df[df["ticker"] == ticker]
-        index = stock_indices.get(ticker, 0)
-        if index >= len(stock_data):
-            index = 0
-
-        row = stock_data.iloc[index] # .iloc is used to get a row by index 
-        stock_indices[ticker] = index + 1  # Move index forward
-
-        # Standardized data format
-        stock_entry = {
-            "time": row["date"],  # Ensure this is a string or timestamp
-            "open": float(row["open"]),
-            "high": float(row["high"]),
-            "low": float(row["low"]),
-            "close": float(row["close"]),
-            "volume": int(row["volume"]),
-        }
-
-        # Store data in Redis
-        redis_key = f"candlestick_data:{ticker}"
-        history = redis_conn.get(redis_key) 
-        if history:
-            history = json.loads(history) # Convert JSON string to Python list
-            
-            if len(history) < 1000:  # Keep only last 1000 candles
-                history.append(stock_entry) # Append new stock entry
-        else:
-            history = [stock_entry] 
 
-        redis_conn.set(redis_key, json.dumps(history)) # Save updated history in Redis , convert Python list to JSON string
-        data[ticker] = stock_entry
+def broadcast_order_results(orders, results):
+    """Send each order's result to its owner's WebSocket group."""
+    channel_layer = get_channel_layer()
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    for order in orders:
+        loop.run_until_complete(channel_layer.group_send(f"user_{order['user_id']}", {
+            "type": "order_result",
+            "message": {"order_id": order["id"], **results[order["id"]]},
+        }))
+    loop.close()
 
-    return data
 
 @shared_task
 def update_stock(selected_stocks=None):
     """Fetch stock data, and send WebSocket updates."""
-     # if no stocks are provided, fetch from the database
-    selected_stocks = ['MSFT','AAPL','GOOGL','AMZN','TSLA','NVDA','NFLX','META'] # example of output ['AAPL', 'GOOGL']
+    # If no stocks are provided, publish every market ticker
+    selected_stocks = selected_stocks or MARKET_TICKERS # example of output ['AAPL', 'GOOGL']
     if not selected_stocks:
         print("No stocks selected.")
         return
@@ -82,45 +79,195 @@ def update_stock(selected_stocks=None):
     print("Updated Stock Data:", data)
 
     # Send update to WebSocket
-    channel_layer = get_channel_layer()
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    loop.run_until_complete(channel_layer.group_send("stock_track", {
-        "type": "send_stock_update",
-        "message": data,
-    }))
-    loop.close()
-    
-    
+    broadcast_stock_update(data)
+
+
+@shared_task
+@single_flight("replay_market", interval=1)
+def replay_market(selected_stocks=None):
+    """Publish as many ticks as are due at the configured replay rate.
+
+    Scheduled every second; pause/resume and the rate live in mainapp.replay.
+    A run still fast-forwarding when the next one is due makes that one a
+    no-op, the ticks it would have applied are picked up by the next run.
+    """
+    steps = due_steps()
+    if steps == 1:
+        update_stock(selected_stocks)
+    elif steps > 1:
+        fast_forward_market(steps, selected_stocks)
+    return steps
+
+
+@shared_task
+def fast_forward_market(steps, selected_stocks=None):
+    """Apply `steps` ticks for `selected_stocks` (default: every ticker) in batched writes.
+
+    Works through the ticks in chunks of MARKET_REPLAY_BATCH. After each
+    chunk, limit orders are checked against the lowest and highest close
+    the chunk passed through, so orders whose price was crossed along the
+    way still fill.
+    """
+    selected_stocks = selected_stocks or MARKET_TICKERS
+    data = {}
+    remaining = steps
+
+    while remaining > 0:
+        chunk = min(remaining, MARKET_REPLAY_BATCH)
+        seq, batch = advance_cursor_bulk(selected_stocks, chunk)
+        if not batch:
+            print("No data found for stocks:", selected_stocks)
+            break
+
+        publish_ticks(batch, seq)  # The whole chunk for all tickers in one round-trip
+        price_ranges = {}
+        for ticker, candles in batch.items():
+            closes = [candle["close"] for candle in candles]
+            price_ranges[ticker] = (min(closes), max(closes))
+        process_limit_orders(price_ranges)
+
+        data = {ticker: candles[-1] for ticker, candles in batch.items()}
+        remaining -= chunk
+
+    print(f"Fast-forwarded {steps - remaining} ticks:", data)
+    if data:
+        broadcast_stock_update(data)
+    return steps - remaining
 
 
 @shared_task
-def process_limit_orders():
-    """Check and execute limit orders."""
-
-    for order in LimitOrder.objects.all():
-        redis_key = f"candlestick_data:{order.stock}"
-        data = redis_conn.get(redis_key)
-
-        if not data:
-            print(f"No data found for stock: {order.stock}")
-            continue
-
-        latest_data = json.loads(data)[-1]  # Get the latest candlestick data
-        market_price = Decimal(latest_data["close"])
-
-        print(f"Checking limit order: {order} | Market Price: {market_price}")
-
-        if (order.order_type == "BUY" and market_price <= order.price) or \
-           (order.order_type == "SELL" and market_price >= order.price):
-            # Execute the order
-            if order.order_type == "BUY":
-                result = buy_stock(order.user, order.stock, order.quantity, order.price, order_type='LIMIT')
-            else:
-                result = sell_stock(order.user, order.stock, order.quantity, order.price, order_type='LIMIT')
-
-            if "error" in result:
-                print(f"Error executing limit order: {result['error']}")
-            else:
-                print(f"Executed limit order: {order}")
-                order.delete()  # Remove the limit order after execution
\ No newline at end of file
+def process_limit_orders(price_ranges=None):
+    """Check and execute limit orders.
+
+    Called by the feed on every tick with only the tickers whose price moved,
+    and by place_order when a new limit order is already marketable.
+    `price_ranges` is {ticker: (lowest, highest)} close seen since the last
+    check; by default the latest close of every ticker is used. The tickers
+    are split into shards (mainapp.shards) and each shard is matched by its
+    own process_limit_order_shard task, so matching runs on several workers.
+    """
+    if price_ranges is None:
+        prices = get_prices()  # Latest close of every ticker in one read
+        price_ranges = {ticker: (price, price) for ticker, price in prices.items()}
+
+    for shard, ranges in split_by_shard(price_ranges).items():
+        queue_ranges(shard, ranges)  # Merged with anything the shard has not matched yet
+        queue = shard_queue(shard)
+        options = {"queue": queue} if queue else {}
+        process_limit_order_shard.apply_async(args=[shard], **options)
+
+
+@shared_task
+def process_limit_order_shard(shard):
+    """Match the pending price ranges of one shard, one worker per shard at a time.
+
+    A run that finds the shard locked leaves its ranges queued for the
+    worker holding it, so overlapping runs coalesce instead of stacking up
+    or matching the same orders twice.
+    """
+    name = f"process_limit_order_shard:{shard}"
+    # Re-checked after releasing: ranges queued while the lock was being
+    # released would otherwise wait for the next tick
+    while has_pending_ranges(shard):
+        lock = shard_lock(shard)
+        if not lock.acquire(blocking=False):
+            record_skip(name)
+            return
+        try:
+            while True:
+                queued_at, ranges = take_ranges(shard)
+                if not ranges:
+                    break
+                started = time.time()
+                try:
+                    match_limit_orders(ranges)
+                except Exception:
+                    record_failure(name)
+                    queue_ranges(shard, ranges, queued_at)  # Put them back for the next run
+                    raise
+                finally:
+                    record_run(name, time.time() - started, lag=started - queued_at)
+        finally:
+            release(lock, name)
+
+
+def match_limit_orders(price_ranges):
+    """Fill the limit orders triggered by {ticker: (low, high)}.
+
+    A BUY fills if the price dipped to its limit, a SELL if it rose to it.
+    Only crossed price levels are looked at, never the whole set of resting
+    orders.
+    """
+    price_ranges = {ticker: (Decimal(low), Decimal(high)) for ticker, (low, high) in price_ranges.items()}
+
+    order_ids = []
+    for ticker, (low, high) in price_ranges.items():
+        order_ids += crossed_limit_orders(ticker, low, high)
+    if not order_ids:
+        return
+
+    # Every triggered order of this tick is filled in one locked transaction
+    results = execute_limit_orders(order_ids)
+
+    for order_id in order_ids:
+        result = results.get(order_id)
+        if result is None:
+            continue  # Gone, or being filled by an overlapping run
+        if "error" in result:
+            print(f"Error executing limit order {order_id}: {result['error']}")
+        else:
+            print(f"Executed limit order {order_id}: {result}")
+
+
+@shared_task
+def process_order_queue():
+    """Apply orders accepted in queue intake mode, in submission order.
+
+    One worker at a time drains the queue in batches of ORDER_INTAKE_BATCH,
+    each applied in a single transaction against one price snapshot, so a
+    user's orders run in sequence. Results are stored for the order_status
+    endpoint and pushed to the user's WebSocket group. Runs that find the
+    queue being drained leave their orders to the worker holding it.
+    """
+    name = "process_order_queue"
+    while has_queued_orders():
+        lock = intake_lock()
+        if not lock.acquire(blocking=False):
+            record_skip(name)
+            return
+        try:
+            while True:
+                orders = claim_orders()
+                if not orders:
+                    break
+                started = time.time()
+                try:
+                    prices = get_prices([order["stock"] for order in orders])
+                    results = apply_orders(orders, prices)  # Skips orders a dead run already committed
+                except Exception:
+                    record_failure(name)  # The batch stays claimed and is retried by the next run
+                    raise
+                complete_orders(orders, results)
+                record_run(name, time.time() - started, lag=started - orders[0]["submitted_at"])
+                broadcast_order_results(orders, results)
+
+                # Fill new limit orders that are already marketable, like place_order does
+                marketable = marketable_limit_ranges(orders, results, prices)
+                if marketable:
+                    process_limit_orders(marketable)
+        finally:
+            release(lock, name)
+
+
+@shared_task
+def sweep_order_queue():
+    """Periodic drain of the order intake queue (see celery.py's beat schedule).
+
+    Orders are otherwise only applied when a new one is submitted, so a
+    batch claimed by a worker that died would wait for the next order.
+    Also drops AppliedOrder rows past ORDER_RESULT_TTL.
+    """
+    pruned = prune_applied_orders()
+    if pruned:
+        print(f"Pruned {pruned} applied orders")
+    process_order_queue()
@@ -1,3 +1,190 @@
-from django.test import TestCase
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.test import Client, TestCase
+from django.urls import reverse
+from .feed import publish_tick
+from .leaderboard import LEADERBOARD_KEY, rebuild_leaderboard
+from .candle_store import redis_conn
+from .models import AppliedOrder, LimitOrder, Transaction, UserProfile, UserStock
+from .order_intake import apply_orders
+from .order_utils import _apply_orders, buy_stock, sell_stock
+from .tasks import process_limit_orders
+from .views import generate_jwt_token, limit_price
 
-# Create your tests here.
+
+class BuyStockTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="trader")
+        UserProfile.objects.create(user=self.user, balance=Decimal("10000.00"))
+
+    def test_average_price_after_two_buys(self):
+        buy_stock(self.user, "AAPL", 1, Decimal("100"))
+        buy_stock(self.user, "AAPL", 1, Decimal("101"))
+
+        holding = UserStock.objects.get(user=self.user, stock="AAPL")
+        self.assertEqual(holding.quantity, 2)
+        self.assertEqual(holding.average_price, Decimal("100.50"))
+        self.assertEqual(UserProfile.objects.get(user=self.user).balance, Decimal("9799.00"))
+
+
+class LimitPriceTests(TestCase):
+    def test_valid_price_is_rounded_to_cents(self):
+        self.assertEqual(limit_price("90.505"), Decimal("90.50"))
+        self.assertIsNone(limit_price(None))
+
+    def test_rejects_prices_that_do_not_fit_a_limit_order(self):
+        for value in ("nan", "inf", "1e12", "-5", "0", "0.001", "abc"):
+            with self.assertRaises(ValueError):
+                limit_price(value)
+
+
+class ApplyOrdersTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="trader")
+        UserProfile.objects.create(user=self.user, balance=Decimal("10000.00"))
+
+    def order(self, order_id, **fields):
+        return {"id": order_id, "user_id": self.user.id, "stock": "AAPL", "quantity": 1,
+                "action": "buy", "order_type": "market", "price": None, **fields}
+
+    def test_invalid_order_does_not_stall_the_orders_behind_it(self):
+        orders = [
+            self.order("a"),
+            self.order("b", order_type="limit", price="abc"),
+            self.order("c", order_type="limit", price="90.00"),
+        ]
+        results = apply_orders(orders, {"AAPL": Decimal("100")})
+
+        self.assertTrue(results["a"]["success"])
+        self.assertIn("error", results["b"])
+        self.assertTrue(results["c"]["success"])
+        self.assertEqual(UserStock.objects.get(user=self.user, stock="AAPL").quantity, 1)
+        self.assertEqual(LimitOrder.objects.filter(user=self.user).count(), 1)
+        self.assertIn("error", AppliedOrder.objects.get(order_id="b").result)
+
+        # A retried batch is not applied a second time
+        self.assertEqual(apply_orders(orders, {"AAPL": Decimal("100")}), results)
+        self.assertEqual(UserStock.objects.get(user=self.user, stock="AAPL").quantity, 1)
+
+
+class PortfolioETagTests(TestCase):
+    def client_for(self, username):
+        user = User.objects.create(username=username)
+        UserProfile.objects.create(user=user, balance=Decimal("10000.00"))
+        return Client(HTTP_AUTHORIZATION=f"Bearer {generate_jwt_token(user)}")
+
+    def test_not_modified_only_for_the_same_user(self):
+        alice, bob = self.client_for("alice"), self.client_for("bob")
+        for name in ("balance", "get_live_prices"):
+            response = alice.get(reverse(name))
+            self.assertEqual(response.status_code, 200)
+            self.assertIn("Authorization", response["Vary"])
+
+            etag = response["ETag"]
+            self.assertEqual(alice.get(reverse(name), HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            self.assertEqual(bob.get(reverse(name), HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class LeaderboardTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create(username="alice")
+        self.bob = User.objects.create(username="bob")
+        for user in (self.alice, self.bob):
+            UserProfile.objects.create(user=user, balance=Decimal("10000.00"))
+        self.tick(AAPL="100", MSFT="50")
+        rebuild_leaderboard()
+
+    def tick(self, **closes):
+        publish_tick({
+            ticker: {"time": "2025-01-02", "open": float(close), "high": float(close),
+                     "low": float(close), "close": float(close), "volume": 1000}
+            for ticker, close in closes.items()
+        })
+
+    def board(self):
+        return dict(redis_conn.zrange(LEADERBOARD_KEY, 0, -1, withscores=True))
+
+    def test_incremental_board_matches_a_rebuild(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            buy_stock(self.alice, "AAPL", 10, Decimal("100"))
+            buy_stock(self.bob, "MSFT", 5, Decimal("50"))
+        self.tick(AAPL="110", MSFT="45")
+        with self.captureOnCommitCallbacks(execute=True):
+            sell_stock(self.alice, "AAPL", 4, Decimal("110"))
+            LimitOrder.objects.create(user=self.bob, stock="AAPL", quantity=3, price=Decimal("105"), order_type="BUY")
+            LimitOrder.objects.create(user=self.alice, stock="AAPL", quantity=2, price=Decimal("100"), order_type="SELL")
+        self.tick(AAPL="104", MSFT="47")
+        with self.captureOnCommitCallbacks(execute=True):
+            process_limit_orders({"AAPL": (Decimal("99"), Decimal("104"))})
+        self.assertFalse(LimitOrder.objects.exists())
+
+        incremental = self.board()
+        rebuild_leaderboard()
+        rebuilt = self.board()
+        self.assertEqual(incremental.keys(), rebuilt.keys())
+        for username, score in rebuilt.items():
+            self.assertAlmostEqual(incremental[username], score, places=6)
+
+
+class ApplyOrderBatchTests(TestCase):
+    """_apply_orders must leave the same state as buy_stock / sell_stock run one by one."""
+
+    def setUp(self):
+        self.batch_user = self.make_user("batch")
+        self.sync_user = self.make_user("sync")
+
+    def make_user(self, username):
+        user = User.objects.create(username=username)
+        UserProfile.objects.create(user=user, balance=Decimal("10000.00"))
+        UserStock.objects.create(user=user, stock="AAPL", quantity=10, average_price=Decimal("100.00"))
+        UserStock.objects.create(user=user, stock="NFLX", quantity=4, average_price=Decimal("300.00"))
+        return user
+
+    def state(self, user):
+        profile = UserProfile.objects.get(user=user)
+        holdings = sorted(UserStock.objects.filter(user=user).values_list("stock", "quantity", "average_price"))
+        trades = list(Transaction.objects.filter(user=user).order_by("id").values_list("stock", "action", "quantity", "price"))
+        return profile.balance, profile.cumulative_profit, holdings, trades
+
+    def assert_matches_sync(self, steps):
+        """Apply [(action, stock, quantity, price)] both ways and compare results and state."""
+        orders = [
+            {"id": index, "user_id": self.batch_user.id, "stock": stock, "quantity": quantity,
+             "price": Decimal(price), "action": action, "order_type": "MARKET"}
+            for index, (action, stock, quantity, price) in enumerate(steps)
+        ]
+        with transaction.atomic():
+            results, _ = _apply_orders(orders)
+
+        trade = {"BUY": buy_stock, "SELL": sell_stock}
+        for index, (action, stock, quantity, price) in enumerate(steps):
+            self.assertEqual(results[index], trade[action](self.sync_user, stock, quantity, Decimal(price)))
+        self.assertEqual(self.state(self.batch_user), self.state(self.sync_user))
+
+    def test_new_and_existing_holdings(self):
+        self.assert_matches_sync([
+            ("BUY", "MSFT", 5, "50"),
+            ("BUY", "AAPL", 5, "110"),
+            ("BUY", "MSFT", 3, "52.50"),
+            ("SELL", "MSFT", 2, "55"),
+        ])
+
+    def test_sell_to_zero_then_buy_back(self):
+        self.assert_matches_sync([
+            ("SELL", "AAPL", 10, "120"),
+            ("BUY", "AAPL", 2, "121"),
+            ("BUY", "TSLA", 1, "200"),
+            ("SELL", "TSLA", 1, "210"),
+            ("BUY", "TSLA", 3, "205"),
+        ])
+
+    def test_bulk_update_and_delete_with_rejections(self):
+        self.assert_matches_sync([
+            ("SELL", "NFLX", 4, "310"),
+            ("SELL", "AAPL", 3, "90"),
+            ("SELL", "GOOGL", 1, "100"),
+            ("SELL", "AAPL", 8, "90"),
+            ("BUY", "AAPL", 1000, "100"),
+            ("BUY", "AAPL", 3, "95.55"),
+        ])
@@ -20,6 +20,8 @@ urlpatterns = [
     path('get_live_prices/', views.get_live_prices, name='get_live_prices'),
     path('sell_stock/', views.sell_stock, name='sell_stock'),
     path('place_order/', views.place_order, name='place_order'),
+    path('place_bulk_orders/', views.place_bulk_orders, name='place_bulk_orders'),
+    path('order_status/<str:order_id>/', views.order_status, name='order_status'),
     path('order_history/', views.order_history, name='order_history'), 
     path('leaderboard/', views.leaderboard, name='leaderboard'),
     path('order_history_ajax/', views.order_history_ajax, name='order_history_ajax'),
@@ -0,0 +1,88 @@
+# Whole-market portfolio valuation with NumPy, for full recomputes such as
+# rebuilding the leaderboard. numpy is imported inside the functions, like
+# in market_data, so importing this module stays cheap.
+
+
+class Holdings:
+    """Every UserStock row as columns: one entry per (user, ticker) position."""
+
+    __slots__ = ("user_ids", "tickers", "ticker_codes", "quantity", "average_price")
+
+    def __init__(self, user_ids, tickers, ticker_codes, quantity, average_price):
+        self.user_ids = user_ids  # int64 per row
+        self.tickers = tickers  # distinct tickers, ticker_codes index into it
+        self.ticker_codes = ticker_codes
+        self.quantity = quantity  # float64 per row
+        self.average_price = average_price  # float64 per row
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    @classmethod
+    def load(cls, queryset=None):
+        """Read all positions (or those of `queryset`) in one query."""
+        import numpy as np
+        from django.db import connection
+        from .models import UserStock
+
+        queryset = UserStock.objects.all() if queryset is None else queryset
+        # A raw cursor skips the ORM's per-row Decimal conversion; the values
+        # go straight into float arrays
+        sql, params = queryset.values_list("user_id", "stock", "quantity", "average_price").query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+
+        if not rows:
+            empty = np.zeros(0)
+            return cls(np.zeros(0, dtype=np.int64), [], np.zeros(0, dtype=np.int64), empty, empty)
+
+        user_ids, stocks, quantity, average_price = zip(*rows)
+        tickers, ticker_codes = np.unique(np.array(stocks, dtype=str), return_inverse=True)
+        return cls(
+            np.array(user_ids, dtype=np.int64),
+            tickers.tolist(),
+            ticker_codes,
+            np.array(quantity, dtype=np.float64),
+            np.array(average_price, dtype=np.float64),
+        )
+
+
+class PortfolioValuation:
+    """Per-user totals from value_portfolios, aligned on `user_ids`."""
+
+    __slots__ = ("user_ids", "unrealized", "exposure", "cost")
+
+    def __init__(self, user_ids, unrealized, exposure, cost):
+        self.user_ids = user_ids
+        self.unrealized = unrealized  # sum of quantity * (price - average_price)
+        self.exposure = exposure  # market value, sum of quantity * price
+        self.cost = cost  # sum of quantity * average_price
+
+    def unrealized_by_user(self):
+        return dict(zip(self.user_ids.tolist(), self.unrealized.tolist()))
+
+
+def value_portfolios(holdings, prices):
+    """Value every position at `prices` ({ticker: price}) and total them per user.
+
+    Prices are looked up once per ticker into a vector indexed by ticker
+    code, then the per-user sums are bincount reductions. Positions in
+    tickers without a price are valued at cost.
+    """
+    import numpy as np
+
+    if not len(holdings):
+        empty = np.zeros(0)
+        return PortfolioValuation(np.zeros(0, dtype=np.int64), empty, empty, empty)
+
+    price_vector = np.array([float(prices.get(ticker, np.nan)) for ticker in holdings.tickers])
+    price = price_vector[holdings.ticker_codes]
+    price = np.where(np.isnan(price), holdings.average_price, price)
+
+    user_ids, user_codes = np.unique(holdings.user_ids, return_inverse=True)
+    count = len(user_ids)
+    unrealized = np.bincount(user_codes, weights=holdings.quantity * (price - holdings.average_price), minlength=count)
+    exposure = np.bincount(user_codes, weights=holdings.quantity * price, minlength=count)
+    cost = np.bincount(user_codes, weights=holdings.quantity * holdings.average_price, minlength=count)
+    return PortfolioValuation(user_ids, unrealized, exposure, cost)
@@ -1,17 +1,23 @@
 from django.shortcuts import render, get_object_or_404 ,redirect
 from django.http import HttpResponse, JsonResponse
-import pandas as pd
-from .tasks import update_stock
+from .market_data import get_tickers, to_unix_time
+from .tasks import process_limit_orders, process_order_queue
+from .order_intake import ORDER_INTAKE_MODE, get_order_status, submit_order
+from .feed import current_candles
+from .candle_store import CANDLE_RESOLUTIONS, get_bars, get_candles, get_candles_between
+from .quotes import get_quote, get_quote_snapshot
+from .portfolio import get_snapshot, snapshot_state
+from .leaderboard import get_around, get_leaderboard, leaderboard_size
 from asgiref.sync import sync_to_async
-import redis
 import json
 from django.db.models import Sum  # Import Sum for aggregation
 from .models import UserProfile, StockDetail ,UserStock,LimitOrder,Transaction# Import your models
-from django.views.decorators.http import require_POST
+from django.views.decorators.http import condition, require_POST
+from django.views.decorators.vary import vary_on_headers
 
 from django.views.decorators.csrf import csrf_exempt
 from decimal import Decimal
-from .order_utils import buy_stock, sell_stock  
+from .order_utils import buy_stock, sell_stock, execute_order_batch, marketable_limit_ranges
 from django.contrib.auth.models import User
 from django.contrib import messages
 from django.contrib.auth import authenticate,login,logout 
@@ -224,20 +230,6 @@ def logout_page(request):
     
     return JsonResponse({'error': 'Method not allowed'}, status=405) 
 
-# Path to CSV file
-CSV_FILE_PATH = os.path.join(
-    settings.BASE_DIR,
-    "mainapp",
-    "multi_stock_data.csv"
-)
-
-
-# Load CSV into a DataFrame
-df = pd.read_csv(CSV_FILE_PATH)
-
-# Dictionary to store current index for each stock
-stock_indices = {ticker: 0 for ticker in df["ticker"].unique()} # output will be {'AAPL': 0, 'GOOGL': 0, 'MSFT': 0, 'AMZN': 0, 'TSLA': 0} , here 0 is the index of the stock
-
 # views.py
 from django.http import JsonResponse
 from django.middleware.csrf import get_token
@@ -246,33 +238,8 @@ def get_csrf(request):
     return JsonResponse({'csrfToken': get_token(request)})
 
 def get_stock_updates(selected_stocks):
-    """Fetch stock data from CSV and simulate real-time updates."""
-    global stock_indices 
-    data = {}
-
-    for ticker in selected_stocks:
-        stock_data = df[df["ticker"] == ticker] 
-        index = stock_indices.get(ticker, 0)  # .get is used to get the value of the key from the dictionary, if the key does not exist then it will return the default value which is 0 , example stock_indices.get('AAPL',0) will return 0 as AAPL is not present in the dictionary
-
-        # If we reach the end of the dataset, loop back to the beginning
-        if index >= len(stock_data):
-            index = 0
-
-        row = stock_data.iloc[index]# iloc is used to get the data from the index
-
-        data[ticker] = {
-            "time": row["date"],  # Ensure this is a string or timestamp
-            "open": float(row["open"]),
-            "high": float(row["high"]),
-            "low": float(row["low"]),
-            "close": float(row["close"]),
-            "volume": int(row["volume"]),
-        }
-
-        # Move to the next index for the next call
-        stock_indices[ticker] = index + 1
-
-    return data
+    """Fetch the current candle of each stock at the feed's shared replay position."""
+    return current_candles(selected_stocks)
 
 
 
@@ -287,7 +254,7 @@ def stockPicker(request):
     
     """Return JSON list of default stocks instead of redirecting"""
     try:
-        default_stocks = df["ticker"].unique().tolist()[:]  # Get first 5 stocks
+        default_stocks = list(get_tickers())
         return JsonResponse({
             "stocks": default_stocks,
             "tracker_url": f"{reverse('stocktracker')}?{urlencode([('stock_picker', stock) for stock in default_stocks], doseq=True)}"
@@ -312,36 +279,54 @@ async def stockTracker(request):
     if not selected_stocks:
         return JsonResponse({"error": "No stocks selected"}, status=400)
 
+    # Read-only: the beat-driven feed is the only writer of the replay position
     initial_data = get_stock_updates(selected_stocks)
-    update_stock.delay(selected_stocks)
 
     return JsonResponse({"data": initial_data}, status=200)
 
 
 
-
-
-redis_conn = redis.from_url(
-    os.environ.get("REDIS_URL"),
-    decode_responses=True
-)
-
 def stock_chart_data(request, stock_symbol):
-    """Fetch stock data from Redis and return it in JSON format."""
-    redis_key = f"candlestick_data:{stock_symbol}"
-    data = redis_conn.get(redis_key)  
+    """Fetch stock data from Redis and return it in JSON format.
+
+    Optional query params: `resolution` (one of CANDLE_RESOLUTIONS, served from
+    the feed's precomputed bars), `limit` (last N candles) or `start` / `end`
+    (date range, raw candles only).
+    """
+    limit = request.GET.get("limit")
+    limit = int(limit) if limit and limit.isdigit() else None
+
+    resolution = request.GET.get("resolution")
+    if resolution:
+        if resolution not in CANDLE_RESOLUTIONS:
+            return JsonResponse({"error": f"Unknown resolution, expected one of {list(CANDLE_RESOLUTIONS)}"}, status=400)
+        chart_data = get_bars(stock_symbol, resolution, limit)
+        if not chart_data:
+            return JsonResponse({"error": "No data found"}, status=404)
+        return JsonResponse(chart_data, safe=False)
+
+    start = request.GET.get("start")
+    end = request.GET.get("end")
+    if start or end:
+        data = get_candles_between(stock_symbol, start, end)
+    else:
+        data = get_candles(stock_symbol, limit)
 
     if not data:
         return JsonResponse({"error": "No data found"}, status=404)
 
-    df = pd.DataFrame(json.loads(data))
-
-    # Ensure the 'time' column is correctly converted to a Unix timestamp
-    df["time"] = pd.to_datetime(df["time"]).astype("int64") // 10**9  
- 
-
-    # Convert DataFrame to JSON format expected by React Chart
-    chart_data = df[["time", "open", "high", "low", "close", "volume"]].to_dict(orient="records")  
+    # Convert to the format expected by React Chart, with 'time' as a Unix timestamp
+    chart_data = [
+        {
+            "time": to_unix_time(candle["time"]),
+            "open": candle["open"],
+            "high": candle["high"],
+            "low": candle["low"],
+            "close": candle["close"],
+            "volume": candle["volume"],
+        }
+        for candle in data
+    ]
     
     return JsonResponse(chart_data, safe=False)
 
@@ -352,13 +337,12 @@ def stock_chart_data(request, stock_symbol):
 
 def fetch_stock_data(selected_stock):
     """Fetch latest candlestick data from Redis."""
-    redis_key = f"candlestick_data:{selected_stock}"
-    data = redis_conn.get(redis_key) 
+    data = get_candles(selected_stock)
 
     if not data:
         return JsonResponse({"error": "No data found for stock"}, status=404)
 
-    return JsonResponse(json.loads(data), safe=False)
+    return JsonResponse(data, safe=False)
 
 def chart_view(request):
     """Fetch stocks selected by the logged-in user."""
@@ -419,13 +403,11 @@ def place_order(request):
         
 
         # Fetch current market price from Redis
-        redis_key = f"candlestick_data:{stock_symbol}"
-        data = redis_conn.get(redis_key)
+        latest_data = get_quote(stock_symbol)  # Get the latest quote
 
-        if not data:
+        if not latest_data:
             return JsonResponse({"error": "No data found for the selected stock"}, status=404)
 
-        latest_data = json.loads(data)[-1]  # Get the latest candlestick data
         market_price = Decimal(latest_data["close"])  # Use the closing price as the market price
 
         # Validate sell orders
@@ -439,6 +421,31 @@ def place_order(request):
             if user_stock.quantity < quantity:
                 return JsonResponse({"error": "Not enough holding shares"}, status=400)
 
+        if ORDER_INTAKE_MODE == "queue":
+            # Acknowledge right away; process_order_queue applies the order
+            # and pushes the result over the user's WebSocket
+            # Everything the consumer relies on is checked here, so no queued
+            # order can fail the batch it is applied in
+            if quantity <= 0:
+                return JsonResponse({"error": "Quantity must be positive"}, status=400)
+            if action not in ("buy", "sell"):
+                return JsonResponse({"error": "Invalid action"}, status=400)
+            if order_type not in ("market", "limit"):
+                return JsonResponse({"error": "Invalid order type"}, status=400)
+            try:
+                queued_price = limit_price(request.POST.get("price")) if order_type == "limit" else None
+            except ValueError:
+                return JsonResponse({"error": "Invalid price"}, status=400)
+            if order_type == "limit" and queued_price is None:
+                return JsonResponse({"error": "Price is required for limit orders"}, status=400)
+
+            order_id = submit_order(
+                request.user.id, stock_symbol, quantity, action, order_type,
+                str(queued_price) if queued_price is not None else None
+            )
+            process_order_queue.delay()
+            return JsonResponse({"success": True, "order_id": order_id, "status": "queued"}, status=202)
+
         if order_type == "market":
             # Execute market order immediately
             if action == "buy":
@@ -473,6 +480,10 @@ def place_order(request):
                 price=limit_price,
                 order_type="BUY" if action == "buy" else "SELL",
             )
+            # Orders are otherwise checked when the price next moves, so fill a
+            # marketable one against the current price right away
+            if (action == "buy" and market_price <= limit_price) or (action != "buy" and market_price >= limit_price):
+                process_limit_orders.delay({stock_symbol: (float(market_price), float(market_price))})
             user_profile = UserProfile.objects.get(user=request.user)
             balance= user_profile.balance
             return JsonResponse({
@@ -487,49 +498,167 @@ def place_order(request):
         # logger.error(f"Error processing order: {str(e)}", exc_info=True)
         return JsonResponse({"error": "Internal server error"}, status=500)
 
+# Most orders one place_bulk_orders request may carry
+BULK_ORDER_LIMIT = getattr(settings, "BULK_ORDER_LIMIT", 100)
+# LimitOrder.price is a DecimalField(max_digits=10, decimal_places=2)
+MAX_LIMIT_PRICE = Decimal("99999999.99")
+
+def limit_price(value):
+    """Parse a limit price to a Decimal with two places, or None if it is missing.
+
+    Raises ValueError unless it is a finite price above zero that fits
+    LimitOrder.price.
+    """
+    if value in (None, ""):
+        return None
+    try:
+        price = Decimal(str(value))
+    except ArithmeticError:
+        raise ValueError(f"Invalid price: {value!r}")
+    if not price.is_finite() or price > MAX_LIMIT_PRICE:
+        raise ValueError(f"Invalid price: {value!r}")
+    price = price.quantize(Decimal("0.01"))
+    if price <= 0:
+        raise ValueError(f"Invalid price: {value!r}")
+    return price
+
+@csrf_exempt
+@require_POST
+@jwt_required
+def place_bulk_orders(request):
+    """Place many market and limit orders in one request.
+
+    Expects a JSON body {"orders": [{"stock_symbol", "quantity", "order_type",
+    "action", "price"}, ...]} with the same fields as place_order. Orders
+    are validated against one price snapshot and the valid ones executed
+    in a single transaction, in the given order. Returns one result per
+    order, in request order.
+    """
+    try:
+        orders = json.loads(request.body).get("orders")
+    except (ValueError, AttributeError):
+        return JsonResponse({"error": "Invalid JSON body"}, status=400)
+    if not isinstance(orders, list) or not orders:
+        return JsonResponse({"error": "orders must be a non-empty list"}, status=400)
+    if len(orders) > BULK_ORDER_LIMIT:
+        return JsonResponse({"error": f"At most {BULK_ORDER_LIMIT} orders per request"}, status=400)
+
+    UserProfile.objects.get_or_create(user=request.user)
+    stocks = [order.get("stock_symbol") for order in orders if isinstance(order, dict)]
+    # One tick for the whole batch
+    quotes = get_quote_snapshot([stock for stock in stocks if isinstance(stock, str)])
+    prices = {stock: Decimal(quote["close"]) for stock, quote in quotes.items()}
+    # Shares held as the batch's orders apply in turn: sells are checked
+    # against the market buys placed before them. The fills re-check both.
+    holdings = dict(UserStock.objects.filter(user=request.user, stock__in=prices).values_list("stock", "quantity"))
+
+    results = {}
+    valid = []
+    for index, order in enumerate(orders):
+        try:
+            stock_symbol = order["stock_symbol"]
+            quantity = int(order["quantity"])
+            order_type = order["order_type"]
+            action = order["action"]
+            if not isinstance(stock_symbol, str):
+                raise TypeError(stock_symbol)
+        except (KeyError, TypeError, ValueError):
+            results[index] = {"error": "Invalid order"}
+            continue
+        try:
+            price = limit_price(order.get("price")) if order_type == "limit" else None
+        except ValueError:
+            results[index] = {"error": "Invalid price"}
+            continue
+
+        if quantity <= 0:
+            results[index] = {"error": "Quantity must be positive"}
+        elif action not in ("buy", "sell"):
+            results[index] = {"error": "Invalid action"}
+        elif order_type not in ("market", "limit"):
+            results[index] = {"error": "Invalid order type"}
+        elif order_type == "limit" and price is None:
+            results[index] = {"error": "Price is required for limit orders"}
+        elif stock_symbol not in prices:
+            results[index] = {"error": "No data found for the selected stock"}
+        elif action == "sell" and stock_symbol not in holdings:
+            results[index] = {"error": "You do not own this stock"}
+        elif action == "sell" and holdings[stock_symbol] < quantity:
+            results[index] = {"error": "Not enough holding shares"}
+        else:
+            if order_type == "market":
+                holdings[stock_symbol] = holdings.get(stock_symbol, 0) + (quantity if action == "buy" else -quantity)
+            valid.append({
+                "id": index,
+                "user_id": request.user.id,
+                "stock": stock_symbol,
+                "quantity": quantity,
+                "action": action,
+                "order_type": order_type,
+                "price": price,
+            })
+
+    if valid:
+        results.update(execute_order_batch(valid, prices))
+        marketable = marketable_limit_ranges(valid, results, prices)
+        if marketable:
+            process_limit_orders.delay({stock: (float(low), float(high)) for stock, (low, high) in marketable.items()})
+
+    balance = UserProfile.objects.filter(user=request.user).values_list("balance", flat=True).get()
+    return JsonResponse({
+        "results": [{"index": index, **results[index]} for index in range(len(orders))],
+        "balance": float(balance),
+    })
+
 @jwt_required
+def order_status(request, order_id):
+    """Status of an order accepted in queue intake mode, with its result once applied."""
+    status = get_order_status(order_id)
+    if not status or status["user_id"] != request.user.id:
+        return JsonResponse({"error": "Order not found"}, status=404)
+    return JsonResponse(status)
+
+def portfolio_state(request):
+    """Read the user's snapshot state once per request, for the ETag and the view."""
+    if not hasattr(request, "portfolio_state"):
+        request.portfolio_state = snapshot_state(request.user.id)
+    return request.portfolio_state
+
+# Both ETags carry the user id, since versions and tick seqs repeat across
+# users, and the responses vary on the Authorization header that picks the user
+def balance_etag(request):
+    epoch, _, version = portfolio_state(request)
+    return f"{request.user.id}-{epoch}-{version}"  # The balance only changes with the user's trades
+
+def live_prices_etag(request):
+    epoch, seq, version = portfolio_state(request)
+    return f"{request.user.id}-{epoch}-{seq}-{version}"
+
+# Clients poll these every few seconds: a matching If-None-Match gets a 304
+# from one Redis read, anything else is served from the user's portfolio
+# snapshot, rebuilt at most once per tick or trade (mainapp.portfolio)
+@vary_on_headers("Authorization")
+@jwt_required
+@condition(etag_func=balance_etag)
 def balance(request):
     """Fetch user's balance."""
     if request.user.is_authenticated:
-        user_profile, _ = UserProfile.objects.get_or_create(user=request.user) 
-        balance = user_profile.balance
-        return JsonResponse({"balance": float(balance)}, status=200)
+        snapshot = get_snapshot(request.user, portfolio_state(request), match_seq=False)
+        return JsonResponse({"balance": snapshot["balance"]}, status=200)
     else:
         return JsonResponse({"error": "User not authenticated"}, status=401)
     
+@vary_on_headers("Authorization")
 @jwt_required
+@condition(etag_func=live_prices_etag)
 def get_live_prices(request):
     """Fetch live prices for the user's bought stocks and calculate profit/loss."""
     if not request.user.is_authenticated:
         return JsonResponse({"error": "User not authenticated"}, status=401)
 
-    # Fetch user's bought stocks
-    user_stocks = UserStock.objects.filter(user=request.user) # wrong : output will be the list of stocks bought by the user , how ? UserStock is a model which has a field user which is a foreign key to the User model , so when we filter the UserStock model with the user=request.user , we get the list of stocks bought by the user
-    live_prices = {}
-
-    for stock in user_stocks:
-        redis_key = f"candlestick_data:{stock.stock}"
-        data = redis_conn.get(redis_key)
-
-        if data:
-            latest_data = json.loads(data)[-1]  # Get the latest candlestick data
-            current_price = Decimal(latest_data["close"])
-            average_price = stock.average_price
-
-            # Calculate profit/loss
-            profit_loss = (current_price - average_price) * stock.quantity
-            profit_loss_percentage = ((current_price - average_price) / average_price) * 100
-
-            live_prices[stock.stock] = {
-                "quantity": stock.quantity,
-                "average_price": float(average_price),
-                "live_price": latest_data["close"],
-                "total_value": float(stock.quantity * latest_data["close"]),
-                "profit_loss": float(profit_loss),  # Total profit/loss in currency
-                "profit_loss_percentage": float(profit_loss_percentage),  # Profit/loss percentage
-            }
-
-    return JsonResponse(live_prices)
+    # Every position is valued at the same tick
+    snapshot = get_snapshot(request.user, portfolio_state(request))
+    return JsonResponse(snapshot["positions"])
 
 @jwt_required
 def order_history(request):
@@ -602,31 +731,52 @@ def order_history_ajax(request):
     return JsonResponse({"orders": all_orders})
 
 
+# Largest page / top-N / neighbourhood the leaderboard endpoint serves at once
+LEADERBOARD_MAX_LIMIT = getattr(settings, "LEADERBOARD_MAX_LIMIT", 100)
+
 @jwt_required
 def leaderboard(request):
-    """Leaderboard showing lifetime profits + current holdings"""
+    """Leaderboard showing lifetime profits + current holdings
+
+    Query parameters (without any, the whole board is returned):
+      ?page=2&limit=50  one page of the ranking
+      ?top=10           the first N users
+      ?around=me&k=5    the requesting user's rank and the k users on either side
+    """
     if not request.user.is_authenticated:
         return JsonResponse({"error": "Authentication required"}, status=401)
 
-    leaderboard_data = []
-    
-    for profile in UserProfile.objects.select_related('user').all():
-        total_profit = profile.cumulative_profit  # Start with realized profits
-        
-        # Add unrealized profits from current holdings
-        for stock in profile.user.userstock_set.all(): # profile.user.userstock_set.all() 
-            try:
-                redis_data = redis_conn.get(f"candlestick_data:{stock.stock}")
-                if redis_data:
-                    current_price = Decimal(json.loads(redis_data)[-1]["close"])
-                    total_profit += (current_price - stock.average_price) * stock.quantity
-            except:
-                continue  # Skip if price data unavailable
-
-        leaderboard_data.append({
-            "username": profile.user.username,
-            "total_profit": float(total_profit.quantize(Decimal('0.01')))
-        })
+    try:
+        page = int(request.GET.get("page", 1))
+        limit = int(request.GET.get("limit", LEADERBOARD_MAX_LIMIT))
+        top = int(request.GET["top"]) if "top" in request.GET else None
+        k = int(request.GET.get("k", 5))
+    except ValueError:
+        return JsonResponse({"error": "page, limit, top and k must be integers"}, status=400)
+    if page < 1 or limit < 1 or k < 0 or (top is not None and top < 1):
+        return JsonResponse({"error": "page, limit and top must be positive, k not negative"}, status=400)
+    limit = min(limit, LEADERBOARD_MAX_LIMIT)
+
+    # Maintained incrementally on fills and ticks (mainapp.leaderboard), each
+    # query below is a range read on the ranking
+    if request.GET.get("around") == "me":
+        rank, leaderboard_data = get_around(request.user.username, min(k, LEADERBOARD_MAX_LIMIT))
+        if rank is None:
+            return JsonResponse({"error": "You are not on the leaderboard yet"}, status=404)
+        return JsonResponse({"leaderboard_data": leaderboard_data, "rank": rank, "total": leaderboard_size()}, status=200)
+
+    if top is not None:
+        leaderboard_data = get_leaderboard(0, min(top, LEADERBOARD_MAX_LIMIT))
+        return JsonResponse({"leaderboard_data": leaderboard_data, "total": leaderboard_size()}, status=200)
+
+    if "page" in request.GET or "limit" in request.GET:
+        leaderboard_data = get_leaderboard((page - 1) * limit, limit)
+        return JsonResponse({
+            "leaderboard_data": leaderboard_data,
+            "page": page,
+            "limit": limit,
+            "total": leaderboard_size(),
+        }, status=200)
 
-    leaderboard_data.sort(key=lambda x: x["total_profit"], reverse=True)
+    leaderboard_data = get_leaderboard()
     return JsonResponse( {"leaderboard_data": leaderboard_data}, status=200) 
\ No newline at end of file
@@ -15,10 +15,13 @@ app.conf.update(timezone='Asia/Kolkata')
 app.config_from_object(settings, namespace='CELERY')
 
 
+# Limit orders are evaluated by the market feed on each tick (mainapp.tasks),
+# so there is nothing to poll for them. The order intake queue is swept so
+# orders left by a worker that died still drain.
 app.conf.beat_schedule = {
-    'process-limit-orders-every-1-seconds': {
-        'task': 'mainapp.tasks.process_limit_orders',  # Task path
-        'schedule': 1.0,  # Run every 1 seconds
+    "sweep-order-queue": {
+        "task": "mainapp.tasks.sweep_order_queue",
+        "schedule": getattr(settings, "ORDER_QUEUE_SWEEP_SECONDS", 30),
     },
 }
 
@@ -14,6 +14,7 @@ from pathlib import Path
 import dj_database_url
 
 import os
+import json
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -244,6 +245,8 @@ print("SENDGRID_API_KEY exists:", bool(SENDGRID_API_KEY))
 print("DEFAULT_FROM_EMAIL:", DEFAULT_FROM_EMAIL)
 
 REDIS_URL = os.getenv("REDIS_URL")
+# Wipe Redis, holdings, orders and balances whenever a process loads the app (mainapp.apps)
+RESET_ON_STARTUP = os.getenv("RESET_ON_STARTUP", "False") == "True"
 CACHES = {
     "default": {
         "BACKEND": "django_redis.cache.RedisCache",
@@ -254,6 +257,41 @@ CACHES = {
     }
 }
 
+# Market data
+CANDLE_HISTORY_WINDOW = int(os.getenv("CANDLE_HISTORY_WINDOW", 1000))  # candles kept per ticker
+MARKET_CACHE_DIR = os.getenv("MARKET_CACHE_DIR", os.path.join(BASE_DIR, "mainapp", "market_cache"))  # built by manage.py build_market_cache
+# Rolled-up bar resolutions maintained by the feed ({name: seconds}) and bars kept per resolution
+CANDLE_RESOLUTIONS = {"1m": 60, "5m": 300, "1h": 3600, "1d": 86400, "1w": 604800}
+CANDLE_ROLLUP_WINDOW = int(os.getenv("CANDLE_ROLLUP_WINDOW", 1000))
+
+# Market replay
+MARKET_TICKERS = ['MSFT', 'AAPL', 'GOOGL', 'AMZN', 'TSLA', 'NVDA', 'NFLX', 'META']
+MARKET_REPLAY_RATE = float(os.getenv("MARKET_REPLAY_RATE", 1 / 40))  # ticks per second, one candle every 40 seconds
+MARKET_REPLAY_MAX_STEPS = int(os.getenv("MARKET_REPLAY_MAX_STEPS", 1000))  # most ticks one replay run catches up
+MARKET_REPLAY_BATCH = int(os.getenv("MARKET_REPLAY_BATCH", 500))  # ticks per write when fast-forwarding
+QUOTE_CACHE_SIZE = int(os.getenv("QUOTE_CACHE_SIZE", 1024))  # tickers kept in each process's quote cache
+QUOTE_CACHE_MAX_AGE = float(os.getenv("QUOTE_CACHE_MAX_AGE", 60))  # seconds before a cached quote is re-read from Redis
+
+# Limit orders
+LIMIT_ORDER_SHARDS = int(os.getenv("LIMIT_ORDER_SHARDS", 4))  # tickers are split over this many matching tasks
+LIMIT_ORDER_SHARD_MAP = json.loads(os.getenv("LIMIT_ORDER_SHARD_MAP", "{}"))  # {ticker: shard} overrides of the crc32 assignment
+LIMIT_ORDER_QUEUE_PREFIX = os.getenv("LIMIT_ORDER_QUEUE_PREFIX", "")  # e.g. "limit_orders." routes shard N to queue limit_orders.N
+LIMIT_ORDER_LOCK_TIMEOUT = int(os.getenv("LIMIT_ORDER_LOCK_TIMEOUT", 30))  # seconds before a dead worker's shard lock expires
+TASK_LOCK_TIMEOUT = int(os.getenv("TASK_LOCK_TIMEOUT", 60))  # same for single-flight periodic tasks (mainapp.task_utils)
+
+# Order intake
+ORDER_INTAKE_MODE = os.getenv("ORDER_INTAKE_MODE", "sync")  # "queue" acknowledges orders with 202 and applies them in batches
+ORDER_INTAKE_BATCH = int(os.getenv("ORDER_INTAKE_BATCH", 200))  # queued orders applied per transaction
+ORDER_RESULT_TTL = int(os.getenv("ORDER_RESULT_TTL", 86400))  # seconds an order's status stays queryable
+ORDER_QUEUE_SWEEP_SECONDS = int(os.getenv("ORDER_QUEUE_SWEEP_SECONDS", 30))  # beat interval draining orders left by a dead worker
+BULK_ORDER_LIMIT = int(os.getenv("BULK_ORDER_LIMIT", 100))  # most orders per place_bulk_orders request
+
+# Leaderboard
+LEADERBOARD_MAX_LIMIT = int(os.getenv("LEADERBOARD_MAX_LIMIT", 100))  # most entries per page / top-N / around-me query
+
+# Portfolio snapshots
+PORTFOLIO_SNAPSHOT_TTL = int(os.getenv("PORTFOLIO_SNAPSHOT_TTL", 300))  # seconds a user's cached snapshot is kept
+
 
 
 
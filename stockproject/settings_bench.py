@@ -0,0 +1,39 @@
+"""Settings for benchmarks/bench_trading.py and the test suite.
+
+Runs the app against a local SQLite file, an in-memory channel layer,
+eager Celery tasks and fakeredis, so the trade path can be timed and
+tested without Postgres, a broker or a Redis server.
+"""
+import os
+
+import fakeredis
+import redis
+
+# Every module opens its connection with redis.from_url at import time,
+# so point that at one shared in-process server before the app loads
+_redis_server = fakeredis.FakeServer()
+redis.from_url = lambda url, **kwargs: fakeredis.FakeRedis(server=_redis_server, **kwargs)
+
+os.environ.setdefault("SECRET_KEY", "bench")
+os.environ.setdefault("JWT_SECRET_KEY", "bench")
+os.environ.setdefault("REDIS_URL", "redis://localhost:6379/0")
+os.environ.setdefault("DATABASE_URL", "sqlite:///bench.sqlite3")
+
+from .settings import *  # noqa: E402,F401,F403
+
+DEBUG = False
+ALLOWED_HOSTS = ["*"]
+SECURE_SSL_REDIRECT = False
+
+DATABASES = {
+    "default": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": os.getenv("BENCH_DB", os.path.join(BASE_DIR, "bench.sqlite3")),
+    }
+}
+CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+CHANNEL_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+
+# Tasks run inline in the calling process
+CELERY_TASK_ALWAYS_EAGER = True
+CELERY_TASK_EAGER_PROPAGATES = True